@@ -1,116 +1,427 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import Optional
 import uvicorn
 import os
 import traceback 
 import database 
+import jobs
 
 import generate_leads
 import enrich_leads
 import generate_messages
 import send_messages
+import pipeline
+import llm_cache
+import llm_client
+import templates
+import export
+import outreach_log
+import events
+import time
+import import_leads
+import metrics
+import profiling
+import shutil
+import tempfile
 
 app = FastAPI(title="Agentic Sales Bot API")
 
 class LeadParams(BaseModel):
     num_leads: int = 10
+    seed: Optional[int] = None
+    workers: int = 1
+    wait: bool = False
+    profile: Optional[str] = None
 
 class EnrichParams(BaseModel):
     mode: str = "offline"
+    concurrency: Optional[int] = None
+    requests_per_minute: Optional[int] = None
+    prompt_batch: Optional[int] = None
+    use_cache: bool = True
+    wait: bool = False
+    profile: Optional[str] = None
+
+class MessageParams(BaseModel):
+    mode: str = "auto"
+    use_cache: bool = True
+    wait: bool = False
+    profile: Optional[str] = None
 
 class SendParams(BaseModel):
     mode: str = "dry_run"
+    wait: bool = False
+    profile: Optional[str] = None
+
+class PipelineParams(BaseModel):
+    num_leads: int = 10
+    seed: Optional[int] = None
+    enrich_mode: str = "offline"
+    message_mode: str = "auto"
+    send_mode: str = "dry_run"
+    wait: bool = False
+    profile: Optional[str] = None
 
 @app.on_event("startup")
 def startup_event():
     try:
         database.init_db()
+        jobs.manager.recover()
         print("API Startup: Database Initialized.")
     except Exception as e:
         print(f"API Startup Error: {e}")
 
 
-@app.post("/generate-leads")
-def api_generate_leads(params: LeadParams):
+def check_profile(profile):
+    if profile is not None:
+        try:
+            profiling.resolve_mode(profile)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def run_stage(kind, func, params, wait, message, profile=None, cleanup=None):
+    """
+    Queues a stage on the job pool and returns its job ID straight away.
+    With `wait` the request blocks until the job finishes (used by the n8n workflow).
+    `profile` (cprofile or sample) profiles the run; fetch it from /profiles/{job_id}.
+    `cleanup()` runs when the job ends, or right away if it could not be queued.
+    """
     try:
-        leads = generate_leads.generate_leads(params.num_leads)
-        return {
-            "status": "success", 
-            "count": len(leads), 
-            "message": f"Successfully generated {len(leads)} leads into Database."
-        }
+        check_profile(profile)
+        job_id = jobs.manager.submit(kind, func, params, profile=profile, cleanup=cleanup)
+    except HTTPException:
+        if cleanup:
+            cleanup()
+        raise
     except Exception as e:
         traceback.print_exc()
+        if cleanup:
+            cleanup()
         raise HTTPException(status_code=500, detail=str(e))
 
+    if not wait:
+        return {"status": "queued", "job_id": job_id, "message": f"{message} queued."}
+
+    job = jobs.manager.wait(job_id)
+    if job["status"] == "FAILED":
+        raise HTTPException(status_code=500, detail=job["error"])
+    return {"status": "success" if job["status"] == "DONE" else job["status"].lower(), "job_id": job_id, "message": f"{message} finished.", "job": job}
+
+@app.post("/generate-leads")
+def api_generate_leads(params: LeadParams):
+    return run_stage(
+        "generate-leads",
+        generate_leads.generate_leads,
+        {"num_leads": params.num_leads, "seed": params.seed, "workers": params.workers},
+        params.wait,
+        f"Generation of {params.num_leads} leads",
+        params.profile
+    )
+
 @app.post("/enrich-leads")
 def api_enrich_leads(params: EnrichParams):
-    try:
-        enrich_leads.enrich_data(mode=params.mode)
-        return {
-            "status": "success", 
-            "mode": params.mode, 
-            "message": f"Enrichment completed in {params.mode} mode."
-        }
-    except Exception as e:
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+    return run_stage(
+        "enrich-leads",
+        enrich_leads.enrich_data,
+        {
+            "mode": params.mode,
+            "concurrency": params.concurrency,
+            "requests_per_minute": params.requests_per_minute,
+            "prompt_batch": params.prompt_batch,
+            "use_cache": params.use_cache
+        },
+        params.wait,
+        f"Enrichment in {params.mode} mode",
+        params.profile
+    )
 
 @app.post("/generate-messages")
-def api_generate_messages():
-    try:
-        generate_messages.generate_messages()
-        return {
-            "status": "success", 
-            "message": "Messages generated for all ENRICHED leads."
-        }
-    except Exception as e:
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+def api_generate_messages(params: Optional[MessageParams] = None):
+    params = params or MessageParams()
+    return run_stage(
+        "generate-messages",
+        generate_messages.generate_messages,
+        {"mode": params.mode, "use_cache": params.use_cache},
+        params.wait,
+        "Message generation for ENRICHED leads",
+        params.profile
+    )
 
 @app.post("/send-messages")
 def api_send_messages(params: SendParams):
+    if params.mode == "live":
+        print("[API] Requesting LIVE mode sending...")
+
+    return run_stage(
+        "send-messages",
+        send_messages.process_sending,
+        {"mode": params.mode},
+        params.wait,
+        f"Messaging process in {params.mode} mode",
+        params.profile
+    )
+
+@app.post("/run-pipeline")
+def api_run_pipeline(params: PipelineParams):
+    return run_stage(
+        "pipeline",
+        pipeline.run_pipeline,
+        {
+            "num_leads": params.num_leads,
+            "seed": params.seed,
+            "enrich_mode": params.enrich_mode,
+            "message_mode": params.message_mode,
+            "send_mode": params.send_mode
+        },
+        params.wait,
+        f"Streaming pipeline for {params.num_leads} leads",
+        params.profile
+    )
+
+@app.post("/import-leads")
+def api_import_leads(
+    file: UploadFile = File(...),
+    format: Optional[str] = Form(None),
+    on_duplicate: str = Form("update"),
+    wait: bool = Form(False),
+    profile: Optional[str] = Form(None)
+):
+    """
+    Imports a CSV or JSONL upload as a job. The upload is copied to a temp file
+    (streamed, never read into memory) that is deleted when the job ends.
+    """
+    check_profile(profile)
     try:
-        if params.mode == "live":
-            print("[API] Requesting LIVE mode sending...")
-            
-        send_messages.process_sending(mode=params.mode)
-        
-        return {
-            "status": "success", 
-            "mode": params.mode, 
-            "message": f"Messaging process finished in {params.mode} mode."
-        }
+        fmt = import_leads.detect_format(file.filename, format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if on_duplicate not in import_leads.ON_DUPLICATE:
+        raise HTTPException(status_code=400, detail="on_duplicate must be 'update' or 'skip'")
+
+    with tempfile.NamedTemporaryFile(prefix="import_", suffix=f".{fmt}", delete=False) as spool:
+        try:
+            shutil.copyfileobj(file.file, spool, 1024 * 1024)
+        except BaseException:
+            spool.close()
+            remove_quietly(spool.name)
+            raise
+    return run_stage(
+        "import-leads",
+        import_leads.import_leads,
+        {"path": spool.name, "fmt": fmt, "on_duplicate": on_duplicate},
+        wait,
+        f"Import of {file.filename}",
+        profile,
+        cleanup=lambda: remove_quietly(spool.name)
+    )
+
+@app.get("/llm-cache")
+def api_llm_cache_stats():
+    return llm_cache.cache.stats()
+
+@app.get("/llm-health")
+def api_llm_health():
+    return llm_client.health()
+
+@app.post("/llm-cache/invalidate")
+def api_llm_cache_invalidate(model: Optional[str] = None):
+    removed = llm_cache.cache.invalidate(model)
+    return {"status": "success", "removed": removed, "message": f"Removed {removed} cached responses."}
+
+@app.get("/templates")
+def api_templates():
+    return templates.describe()
+
+@app.post("/templates/reload")
+def api_reload_templates():
+    try:
+        template_set = templates.reload()
     except Exception as e:
-        print("CRITICAL ERROR IN SEND_MESSAGES:")
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=400, detail=f"Template reload failed: {e}")
+    return {"status": "success", "categories": list(template_set.variants), "message": "Templates reloaded."}
+
+@app.get("/jobs")
+def api_list_jobs(limit: int = 20):
+    return {"jobs": jobs.manager.list(limit)}
+
+@app.get("/jobs/{job_id}")
+def api_get_job(job_id: str):
+    job = jobs.manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs/{job_id}/cancel")
+def api_cancel_job(job_id: str):
+    if jobs.manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not jobs.manager.cancel(job_id):
+        return {"status": "error", "message": "Job already finished."}
+    return {"status": "success", "message": "Cancellation requested."}
+
+
+@app.get("/profiles")
+def api_profiles(limit: int = 20):
+    return {"profiles": profiling.list_profiles(limit)}
+
+@app.get("/profiles/{run_id}")
+def api_profile(run_id: str):
+    """Phase spans, top functions and timing of a profiled job or CLI run"""
+    try:
+        summary = profiling.load(run_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return summary
+
+@app.get("/profiles/{run_id}/artifact")
+def api_profile_artifact(run_id: str):
+    """The raw profile: pstats .prof (cprofile) or collapsed stacks for flame graphs (sample)"""
+    try:
+        path = profiling.artifact_path(run_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile artifact not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=os.path.basename(path))
+
+@app.get("/logs")
+def api_logs(
+    lines: int = 200,
+    cursor: Optional[str] = None,
+    level: Optional[str] = None,
+    lead: Optional[str] = None
+):
+    """
+    Without `cursor`: the last `lines` log lines. With `cursor`: only lines written since.
+    Both return the cursor for the next call. `lead` matches a lead id, name or email.
+    """
+    try:
+        if cursor:
+            return outreach_log.follow(cursor, level=level, lead=lead)
+        return outreach_log.tail(lines, level=level, lead=lead)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/events")
+def api_events(
+    lead_id: Optional[str] = None,
+    channel: Optional[str] = None,
+    status: Optional[str] = None,
+    mode: Optional[str] = None,
+    before_id: Optional[int] = None,
+    limit: int = database.PAGE_SIZE
+):
+    """Send events, newest first; pass next_before back as `before_id` for older ones"""
+    try:
+        return database.query_send_events(
+            {"lead_id": lead_id, "channel": channel, "status": status, "mode": mode}, before_id=before_id, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/events/summary")
+def api_events_summary(hours: float = 24):
+    return {**database.send_event_summary(time.time() - hours * 3600), "writer": events.writer.stats()}
+
+@app.get("/leads/{lead_id}/events")
+def api_lead_events(lead_id: str, limit: int = database.PAGE_SIZE):
+    """Delivery history of one lead"""
+    return database.query_send_events({"lead_id": lead_id}, limit=limit)
 
 @app.post("/clear-logs")
 def api_clear_logs():
+    """Rotates the log: the dashboard starts from an empty file and history is kept in the backups"""
     try:
-        with open("outreach.log", "w"):
-            pass 
-        return {"status": "success", "message": "Logs cleared successfully."}
+        outreach_log.rotate()
+        return {"status": "success", "message": "Logs rotated successfully."}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@app.get("/leads")
+def api_list_leads(
+    columns: Optional[str] = None,
+    status: Optional[str] = None,
+    industry: Optional[str] = None,
+    persona: Optional[str] = None,
+    country: Optional[str] = None,
+    sort: str = "rowid",
+    order: str = "asc",
+    cursor: Optional[str] = None,
+    limit: int = database.PAGE_SIZE
+):
+    """One page of leads; pass next_cursor back as `cursor` for the following page"""
+    try:
+        return database.page_leads(
+            columns=[c.strip() for c in columns.split(",") if c.strip()] if columns else None,
+            filters={"status": status, "industry": industry, "persona": persona, "country": country},
+            sort=sort,
+            order=order,
+            cursor=cursor,
+            limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/export")
+def api_export(
+    format: str = "csv",
+    columns: Optional[str] = None,
+    status: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None
+):
+    """
+    Streams leads as CSV, JSONL or Parquet. `status` takes a comma-separated list,
+    `since`/`until` are ISO dates on created_at (until is exclusive).
+    """
+    try:
+        chunks, media_type, extension = export.stream(
+            format,
+            columns=[c.strip() for c in columns.split(",") if c.strip()] if columns else None,
+            status=status,
+            since=since,
+            until=until
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="leads_export.{extension}"'}
+    )
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus scrape endpoint: stage counters, latency histograms and queue gauges"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/analytics")
+def api_analytics():
+    try:
+        return database.get_analytics()
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/status")
 def api_status():
     try:
         conn = database.get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT status, COUNT(*) FROM leads GROUP BY status")
-        rows = cursor.fetchall()
         
         stats = {"NEW": 0, "ENRICHED": 0, "MESSAGED": 0, "SENT": 0, "FAILED": 0, "SENT_DRY_RUN": 0}
-        
-        for row in rows:
-            status_name = row['status']
-            count = row[1]
-            stats[status_name] = count
+        stats.update(database.get_lead_stats(conn)["status"])
             
         conn.close()
         return stats
@@ -1,15 +1,14 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
 import requests
 import time
 import plotly.express as px
 import plotly.graph_objects as go
-import os
+import database
+import outreach_log
 
 API_URL = "http://localhost:8000"
-DB_PATH = "leads.db"
-LOG_FILE = "outreach.log"
+LOG_LINES = 200
 
 st.set_page_config(
     page_title="Agentic AI Pipeline Monitor",
@@ -36,14 +35,67 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-def get_db_data():
+TABLE_COLUMNS = ["full_name", "company_name", "role", "industry", "country", "status", "email"]
+TABLE_PAGE_SIZES = [25, 50, 100, 250]
+SORT_OPTIONS = {
+    "Newest first": ("rowid", "desc"),
+    "Oldest first": ("rowid", "asc"),
+    "Name": ("full_name", "asc"),
+    "Company": ("company_name", "asc"),
+    "Country": ("country", "asc"),
+    "Status": ("status", "asc")
+}
+
+def get_leads_page(filters, sort, order, cursor, limit):
+    """One page of the lead table from GET /leads, or straight from the database when the API is down"""
+    params = {"columns": ",".join(TABLE_COLUMNS), "sort": sort, "order": order, "limit": limit}
+    filters = {k: v for k, v in filters.items() if v}
+    params.update(filters)
+    if cursor:
+        params["cursor"] = cursor
+    try:
+        response = requests.get(f"{API_URL}/leads", params=params, timeout=5)
+        if response.status_code == 200:
+            return response.json()
+    except requests.RequestException:
+        pass
+    try:
+        return database.page_leads(TABLE_COLUMNS, filters, sort, order, cursor, limit)
+    except Exception:
+        return {"leads": [], "next_cursor": None}
+
+def get_log_lines(cursor, level, lead):
+    """New log lines since `cursor` (or the last LOG_LINES), from GET /logs or the log file directly"""
+    params = {"lines": LOG_LINES, "level": level or None, "lead": lead or None, "cursor": cursor}
     try:
-        conn = sqlite3.connect(DB_PATH)
-        df = pd.read_sql_query("SELECT * FROM leads", conn)
-        conn.close()
-        return df
+        response = requests.get(f"{API_URL}/logs", params={k: v for k, v in params.items() if v}, timeout=5)
+        if response.status_code == 200:
+            return response.json()
+    except requests.RequestException:
+        pass
+    try:
+        if cursor:
+            return outreach_log.follow(cursor, level=level, lead=lead)
+        return outreach_log.tail(LOG_LINES, level=level, lead=lead)
+    except (OSError, ValueError):
+        return {"lines": [], "cursor": None}
+
+def get_api_json(path, params=None, fallback=None):
+    """GET an API path, or compute the same payload locally with `fallback` when the API is down"""
+    try:
+        response = requests.get(f"{API_URL}{path}", params=params, timeout=5)
+        if response.status_code == 200:
+            return response.json()
+    except requests.RequestException:
+        pass
+    try:
+        return fallback() if fallback else None
     except Exception:
-        return pd.DataFrame()
+        return None
+
+def get_analytics():
+    """Aggregate counters from the API, or straight from the database when the API is down"""
+    return get_api_json("/analytics", None, database.get_analytics) or {"total": 0, "funnel": {}, "industry": {}}
 
 with st.sidebar:
     st.header("⚙️ Pipeline Controls")
@@ -86,21 +138,18 @@ with st.sidebar:
         status_text = st.empty()
         
         try:
-            status_text.text(f"Generating {num_leads} Leads...")
-            requests.post(f"{API_URL}/generate-leads", json={"num_leads": num_leads})
-            progress_bar.progress(25)
-            
-            status_text.text(f"Enriching Leads ({enrich_mode})...")
-            requests.post(f"{API_URL}/enrich-leads", json={"mode": enrich_mode})
-            progress_bar.progress(50)
-            
-            status_text.text("Generating Messages...")
-            requests.post(f"{API_URL}/generate-messages")
-            progress_bar.progress(75)
-            
-            status_text.text(f"Sending Messages ({mode_value})...")
-            requests.post(f"{API_URL}/send-messages", json={"mode": mode_value})
-            progress_bar.progress(100)
+            payload = {"num_leads": num_leads, "enrich_mode": enrich_mode, "send_mode": mode_value}
+            job_id = requests.post(f"{API_URL}/run-pipeline", json=payload).json()["job_id"]
+            while True:
+                job = requests.get(f"{API_URL}/jobs/{job_id}").json()
+                if job["total"]:
+                    progress_bar.progress(int(min(job["processed"] / job["total"], 1.0) * 100))
+                    status_text.text(f"Streaming Pipeline: {job['processed']}/{job['total']} leads sent...")
+                if job["status"] not in ("QUEUED", "RUNNING"):
+                    break
+                time.sleep(0.5)
+            if job["status"] != "DONE":
+                raise RuntimeError(f"Pipeline {job['status']}: {job['error']}")
             
             status_text.success("✅ Complete!")
             time.sleep(1)
@@ -121,10 +170,9 @@ with st.sidebar:
     with col_b:
         if st.button("🗑️ Clear DB"):
             try:
-                conn = sqlite3.connect(DB_PATH)
+                conn = database.get_db_connection()
                 conn.execute("DELETE FROM leads")
                 conn.commit()
-                conn.close()
                 st.success("Cleared!")
             except Exception as e:
                 st.error(f"Error: {e}")
@@ -135,23 +183,11 @@ with st.sidebar:
     st.divider()
     
     st.subheader("Logs & Export")
-    
-    if st.button("💾 Download Leads (CSV)"):
-        try:
-            conn = sqlite3.connect(DB_PATH)
-            csv_df = pd.read_sql_query("SELECT * FROM leads", conn)
-            conn.close()
-            csv_data = csv_df.to_csv(index=False).encode('utf-8')
-            
-            st.download_button(
-                label="Click to Download CSV",
-                data=csv_data,
-                file_name="leads_export.csv",
-                mime="text/csv"
-            )
-        except:
-            st.error("No data to export")
 
+    # The browser downloads straight from the API's streaming export; nothing passes through Streamlit
+    export_format = st.selectbox("Export format:", ["csv", "jsonl", "parquet"], key="export_format")
+    st.link_button("💾 Download Leads", f"{API_URL}/export?format={export_format}")
+    
     if st.button("🧹 Clear Logs"):
         try:
             response = requests.post(f"{API_URL}/clear-logs")
@@ -160,12 +196,12 @@ with st.sidebar:
             else:
                 st.error(f"API Error: {response.text}")
         except:
-            if os.path.exists(LOG_FILE):
-                try:
-                    open(LOG_FILE, "w").close()
-                    st.success("Logs Cleared!")
-                except:
-                    st.error("Cannot clear logs.")
+            try:
+                outreach_log.rotate()
+                st.success("Logs Cleared!")
+            except OSError:
+                st.error("Cannot clear logs.")
+        st.session_state.pop("log_query", None)
         
         time.sleep(1)
         st.rerun()
@@ -175,20 +211,14 @@ st.markdown("<h1 style='text-align: center;'>MCP Pipeline Monitor</h1>", unsafe_
 st.markdown("<p style='text-align: center; color: gray;'>Autonomous Lead Generation & Outreach System</p>", unsafe_allow_html=True)
 st.divider()
 
-df = get_db_data()
+analytics = get_analytics()
+funnel = analytics.get("funnel", {})
 
-if not df.empty:
-    total_leads = len(df)
-    enriched_count = len(df[df['status'] != 'NEW'])
-    messaged_count = len(df[df['status'].isin(['MESSAGED', 'SENT', 'SENT_DRY_RUN'])])
-    sent_count = len(df[df['status'].isin(['SENT', 'SENT_DRY_RUN'])])
-    failed_count = len(df[df['status'] == 'FAILED'])
-else:
-    total_leads = 0
-    enriched_count = 0
-    messaged_count = 0
-    sent_count = 0
-    failed_count = 0
+total_leads = funnel.get("total", 0)
+enriched_count = funnel.get("enriched", 0)
+messaged_count = funnel.get("messaged", 0)
+sent_count = funnel.get("sent", 0)
+failed_count = funnel.get("failed", 0)
 
 col1, col2, col3, col4, col5 = st.columns(5)
 col1.metric("Total Leads", total_leads)
@@ -200,9 +230,32 @@ col5.metric("Failed", failed_count)
 st.divider()
 
 st.subheader("📋 Lead Database")
+
+filter_cols = st.columns(6)
+filters = {
+    "status": filter_cols[0].selectbox("Status", [""] + sorted(s for s in analytics.get("status", {}) if s), key="filter_status"),
+    "industry": filter_cols[1].selectbox("Industry", [""] + sorted(i for i in analytics.get("industry", {}) if i), key="filter_industry"),
+    "persona": filter_cols[2].selectbox("Persona", [""] + sorted(p for p in analytics.get("persona", {}) if p), key="filter_persona"),
+    "country": filter_cols[3].text_input("Country", key="filter_country").strip()
+}
+sort_label = filter_cols[4].selectbox("Sort", list(SORT_OPTIONS), key="table_sort")
+page_size = filter_cols[5].selectbox("Rows", TABLE_PAGE_SIZES, index=1, key="table_page_size")
+sort, order = SORT_OPTIONS[sort_label]
+
+# Cursors of the pages visited so far; reset whenever the query changes
+query_key = (tuple(filters.values()), sort, order, page_size)
+if st.session_state.get("table_query") != query_key:
+    st.session_state.table_query = query_key
+    st.session_state.table_cursors = [None]
+
+page = get_leads_page(filters, sort, order, st.session_state.table_cursors[-1], page_size)
+df = pd.DataFrame(page["leads"], columns=["id"] + TABLE_COLUMNS)
+
 if not df.empty:
+    page_number = len(st.session_state.table_cursors)
+    st.caption(f"Page {page_number} · {len(df)} rows · {total_leads} leads in total")
     st.dataframe(
-        df[["full_name", "company_name", "role", "industry", "status", "email"]],
+        df[TABLE_COLUMNS],
         use_container_width=True,
         hide_index=True,
         column_config={
@@ -214,12 +267,31 @@ if not df.empty:
             "email": st.column_config.LinkColumn("Email")
         }
     )
+
+    nav_prev, nav_next, nav_csv = st.columns(3)
+    with nav_prev:
+        if st.button("⬅️ Previous", disabled=page_number == 1):
+            st.session_state.table_cursors.pop()
+            st.rerun()
+    with nav_next:
+        if st.button("Next ➡️", disabled=not page["next_cursor"]):
+            st.session_state.table_cursors.append(page["next_cursor"])
+            st.rerun()
+    with nav_csv:
+        st.download_button(
+            label="💾 Download Page (CSV)",
+            data=df.to_csv(index=False).encode('utf-8'),
+            file_name=f"leads_page_{page_number}.csv",
+            mime="text/csv"
+        )
+elif total_leads:
+    st.info("No leads match these filters.")
 else:
     st.info("Database is empty. Use the sidebar to generate leads.")
 
 st.divider()
 
-if not df.empty:
+if total_leads:
     st.subheader("📊 Live Pipeline Analytics")
     
     col_chart1, col_chart2 = st.columns(2)
@@ -238,10 +310,11 @@ if not df.empty:
         st.plotly_chart(fig_funnel, use_container_width=True)
 
     with col_chart2:
-        if "industry" in df.columns:
+        industries = analytics.get("industry", {})
+        if industries:
             fig_pie = px.pie(
-                df, 
-                names="industry", 
+                names=list(industries.keys()),
+                values=list(industries.values()),
                 title="Lead Distribution by Industry",
                 hole=0.4
             )
@@ -251,19 +324,55 @@ if not df.empty:
 else:
     st.caption("Charts will appear here once data is generated.")
 
+st.divider()
+st.subheader("📬 Delivery Events")
+
+summary = get_api_json(
+    "/events/summary", {"hours": 24},
+    lambda: database.send_event_summary(time.time() - 24 * 3600)
+) or {}
+if summary.get("outcomes"):
+    st.caption("Outcomes in the last 24 hours")
+    st.dataframe(pd.DataFrame(summary["outcomes"]), use_container_width=True, hide_index=True)
+else:
+    st.caption("No send events in the last 24 hours.")
+
+history_lead = st.text_input("Delivery history for lead id", key="history_lead").strip()
+if history_lead:
+    history = get_api_json(
+        f"/leads/{history_lead}/events", None,
+        lambda: database.query_send_events({"lead_id": history_lead})
+    ) or {}
+    if history.get("events"):
+        history_df = pd.DataFrame(history["events"])
+        history_df["ts"] = pd.to_datetime(history_df["ts"], unit="s")
+        st.dataframe(history_df, use_container_width=True, hide_index=True)
+    else:
+        st.caption("No send events for this lead.")
+
 st.divider()
 st.subheader("📜 Recent Outreach Logs (Live)")
 
+log_level_col, log_lead_col = st.columns(2)
+log_level = log_level_col.selectbox("Level", ["", "INFO", "WARNING", "ERROR"], key="log_level")
+log_lead = log_lead_col.text_input("Lead (id, name or email)", key="log_lead").strip()
+
+# Keep the last LOG_LINES lines between reruns and only fetch what was appended since
+if st.session_state.get("log_query") != (log_level, log_lead):
+    st.session_state.log_query = (log_level, log_lead)
+    st.session_state.log_lines = []
+    st.session_state.log_cursor = None
+
+log_page = get_log_lines(st.session_state.log_cursor, log_level, log_lead)
+st.session_state.log_lines = (st.session_state.log_lines + log_page["lines"])[-LOG_LINES:]
+st.session_state.log_cursor = log_page["cursor"]
+
 log_container = st.container(height=400, border=True)
 
 with log_container:
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "r") as f:
-            lines = f.readlines()
-            if lines:
-                for line in reversed(lines):
-                    st.text(line.strip())
-            else:
-                st.caption("Log file is empty. Waiting for pipeline activity...")
+    if st.session_state.log_lines:
+        st.text("\n".join(reversed(st.session_state.log_lines)))
+    elif log_page["cursor"]:
+        st.caption("No matching log lines yet. Waiting for pipeline activity...")
     else:
         st.info("No logs generated yet. Run the pipeline to see AI messages here.")
\ No newline at end of file
@@ -1,18 +1,133 @@
 import sqlite3
+import base64
 import json
 import os
+import socket
+import sys
+import threading
+import time
+import uuid
+import weakref
 
-DB_NAME = "leads.db"
+import metrics
+import profiling
+
+DB_NAME = os.getenv("LEADS_DB", "leads.db")
+
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # negative = KiB, so 64 MiB
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "30"))
+
+# Store pain_points/buying_triggers/generated_messages in side tables instead of the leads row
+SIDE_TABLE_PAYLOADS = os.getenv("LEADS_SIDE_TABLES", "0") == "1"
+
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+# How long a worker may hold claimed leads before other workers can take them over
+LEASE_SECONDS = float(os.getenv("LEASE_SECONDS", "600"))
+
+class PooledConnection(sqlite3.Connection):
+    """
+    Connection owned by the ConnectionManager.
+    close() only discards uncommitted work and keeps the connection open for
+    the next caller on the same thread. Use really_close() to close it for good.
+    """
+
+    def commit(self):
+        with profiling.span("db_write"):
+            super().commit()
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def really_close(self):
+        super().close()
+
+class ConnectionManager:
+    """
+    Hands out one persistent connection per thread (and per process).
+    Every connection runs in WAL mode, so readers such as the dashboard
+    do not block pipeline writers and vice versa.
+    """
+
+    def __init__(self, path=DB_NAME, synchronous=SQLITE_SYNCHRONOUS, cache_size=SQLITE_CACHE_SIZE,
+                 mmap_size=SQLITE_MMAP_SIZE, busy_timeout=SQLITE_BUSY_TIMEOUT):
+        self.path = path
+        self.synchronous = synchronous
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+        self.local = threading.local()
+        self.connections = weakref.WeakSet()
+        self.lock = threading.Lock()
+
+    def connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            check_same_thread=False,
+            factory=PooledConnection
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def get(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = self.connect()
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+            with self.lock:
+                self.connections.add(conn)
+        return conn
+
+    def close_all(self):
+        with self.lock:
+            connections = list(self.connections)
+            self.connections = weakref.WeakSet()
+        for conn in connections:
+            try:
+                conn.really_close()
+            except sqlite3.Error:
+                pass
+        self.local = threading.local()
+
+manager = ConnectionManager()
+
+def configure(path=None, **pragmas):
+    """Points the module at another database file and/or pragma settings (used by tools and benchmarks)"""
+    global manager, DB_NAME
+    manager.close_all()
+    DB_NAME = path or DB_NAME
+    manager = ConnectionManager(DB_NAME, **pragmas)
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
-    conn.row_factory = sqlite3.Row 
-    return conn
+    return manager.get()
 
-def init_db():
-    conn = get_db_connection()
-    c = conn.cursor()
-    
+LEAD_COLUMNS = [
+    "id", "full_name", "company_name", "role", "industry", "website", "email",
+    "linkedin_url", "country", "status", "pain_points", "buying_triggers",
+    "company_size", "persona", "confidence_score", "generated_messages", "message_source", "created_at",
+    "duplicate_of"
+]
+
+# Heavy JSON columns that can live in side tables instead of the wide leads row
+PAYLOAD_TABLES = {
+    "pain_points": "lead_enrichment",
+    "buying_triggers": "lead_enrichment",
+    "generated_messages": "lead_messages"
+}
+PAYLOAD_ALIASES = {"lead_enrichment": "e", "lead_messages": "m"}
+
+def _create_leads_table(c):
     c.execute('''
         CREATE TABLE IF NOT EXISTS leads (
             id TEXT PRIMARY KEY,
@@ -38,13 +153,644 @@ def init_db():
             message_source TEXT
         )
     ''')
-    
-    conn.commit()
+
+def _add_lookup_indexes(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_leads_status ON leads(status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_leads_industry ON leads(industry)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_leads_persona ON leads(persona)")
+
+def _add_lease_columns(c):
+    c.execute("ALTER TABLE leads ADD COLUMN claimed_by TEXT")
+    c.execute("ALTER TABLE leads ADD COLUMN lease_expires REAL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_leads_claimed_by ON leads(claimed_by) WHERE claimed_by IS NOT NULL")
+
+def _add_jobs_table(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT,
+            params TEXT,
+            status TEXT,
+            processed INTEGER DEFAULT 0,
+            total INTEGER,
+            result TEXT,
+            error TEXT,
+            cancel_requested INTEGER DEFAULT 0,
+            created_at REAL,
+            started_at REAL,
+            finished_at REAL
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs(created_at)")
+
+def _add_payload_tables(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS lead_enrichment (
+            lead_id TEXT PRIMARY KEY REFERENCES leads(id) ON DELETE CASCADE,
+            pain_points TEXT,
+            buying_triggers TEXT
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS lead_messages (
+            lead_id TEXT PRIMARY KEY REFERENCES leads(id) ON DELETE CASCADE,
+            generated_messages TEXT
+        )
+    ''')
+
+STATS_DIMENSIONS = ["status", "industry", "persona", "message_source"]
+
+def _stat_upsert(dimension, value, delta):
+    return (
+        f"INSERT INTO lead_stats (dimension, value, count) VALUES ('{dimension}', COALESCE({value}, ''), {delta}) "
+        f"ON CONFLICT (dimension, value) DO UPDATE SET count = count + ({delta});"
+    )
+
+def _add_lead_stats(c):
+    """
+    Aggregate counters kept current by triggers, so analytics never scan leads.
+    NULL values are counted under ''. The ('total', '') row counts all leads.
+    """
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS lead_stats (
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, value)
+        ) WITHOUT ROWID
+    ''')
+
+    inserts = [_stat_upsert("total", "''", 1)] + [_stat_upsert(d, f"NEW.{d}", 1) for d in STATS_DIMENSIONS]
+    deletes = [_stat_upsert("total", "''", -1)] + [_stat_upsert(d, f"OLD.{d}", -1) for d in STATS_DIMENSIONS]
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_lead_stats_insert AFTER INSERT ON leads BEGIN {' '.join(inserts)} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_lead_stats_delete AFTER DELETE ON leads BEGIN {' '.join(deletes)} END")
+    for d in STATS_DIMENSIONS:
+        c.execute(
+            f"CREATE TRIGGER IF NOT EXISTS trg_lead_stats_update_{d} AFTER UPDATE OF {d} ON leads "
+            f"WHEN OLD.{d} IS NOT NEW.{d} BEGIN {_stat_upsert(d, f'OLD.{d}', -1)} {_stat_upsert(d, f'NEW.{d}', 1)} END"
+        )
+
+    # Backfill from existing rows
+    c.execute("DELETE FROM lead_stats")
+    c.execute("INSERT INTO lead_stats (dimension, value, count) SELECT 'total', '', COUNT(*) FROM leads")
+    for d in STATS_DIMENSIONS:
+        c.execute(f"INSERT INTO lead_stats (dimension, value, count) SELECT '{d}', COALESCE({d}, ''), COUNT(*) FROM leads GROUP BY 1, 2")
+
+def _add_browse_indexes(c):
+    """Indexes for GET /leads: the country filter and the name sort orders (rowid is the tiebreak)"""
+    c.execute("CREATE INDEX IF NOT EXISTS idx_leads_country ON leads(country)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_leads_company_name ON leads(company_name)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_leads_full_name ON leads(full_name)")
+
+# SQL expression for the current time in unix seconds (works on SQLite versions without unixepoch())
+CREATED_AT_SQL = "(julianday('now') - 2440587.5) * 86400.0"
+
+def _add_created_at(c):
+    """Insert time (unix seconds) for date-filtered exports; leads created before this migration stay NULL"""
+    c.execute("ALTER TABLE leads ADD COLUMN created_at REAL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_leads_created_at ON leads(created_at)")
+
+DEDUPE_COLUMNS = ["email", "linkedin_url"]
+
+def _add_contact_dedupe(c):
+    """
+    Unique email and linkedin_url among live leads. Rows that already share a value with an
+    older lead are kept but marked duplicate_of = that lead's id, and the unique indexes
+    only cover rows with duplicate_of IS NULL, so existing data never blocks the migration.
+    """
+    c.execute("ALTER TABLE leads ADD COLUMN duplicate_of TEXT")
+    for col in DEDUPE_COLUMNS:
+        c.execute(f'''
+            UPDATE leads SET duplicate_of = dup.first_id
+            FROM (
+                SELECT rowid AS rid,
+                       FIRST_VALUE(id) OVER (PARTITION BY {col} ORDER BY rowid) AS first_id,
+                       ROW_NUMBER() OVER (PARTITION BY {col} ORDER BY rowid) AS n
+                FROM leads WHERE {col} IS NOT NULL AND duplicate_of IS NULL
+            ) dup
+            WHERE leads.rowid = dup.rid AND dup.n > 1
+        ''')
+        c.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_leads_{col}_unique ON leads({col}) WHERE duplicate_of IS NULL")
+
+def _add_send_events(c):
+    """Append-only delivery history, one row per message outcome (no FK: history outlives deleted leads)"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS send_events (
+            id INTEGER PRIMARY KEY,
+            ts REAL NOT NULL,
+            lead_id TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempt INTEGER,
+            latency_ms REAL,
+            smtp_code INTEGER,
+            error TEXT,
+            mode TEXT
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_send_events_lead ON send_events(lead_id, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_send_events_ts ON send_events(ts)")
+
+def _add_job_owner(c):
+    """host:pid of the process running each job, so startup recovery leaves live processes' jobs alone"""
+    c.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+# Append-only: migration N brings a database from user_version N-1 to N.
+# Version 0 is either an empty file or a leads.db created before versioning.
+MIGRATIONS = [
+    _create_leads_table,
+    _add_lookup_indexes,
+    _add_payload_tables,
+    _add_lease_columns,
+    _add_jobs_table,
+    _add_lead_stats,
+    _add_browse_indexes,
+    _add_created_at,
+    _add_contact_dedupe,
+    _add_send_events,
+    _add_job_owner,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    """Applies pending migrations, one transaction per step. Safe to run from several processes."""
+    applied = []
+    for version, step in enumerate(MIGRATIONS, start=1):
+        if get_schema_version(conn) >= version:
+            continue
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-check under the write lock in case another process migrated first
+            if get_schema_version(conn) < version:
+                step(conn.cursor())
+                conn.execute(f"PRAGMA user_version={version}")
+                applied.append(version)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
+
+def init_db():
+    conn = get_db_connection()
+    applied = migrate(conn)
     conn.close()
-    print(f"Database initialized: {DB_NAME}")
+    if applied:
+        print(f"Database initialized: {DB_NAME} (schema v{SCHEMA_VERSION}, applied {applied})")
+    else:
+        print(f"Database initialized: {DB_NAME}")
+
+def get_lead_stats(conn=None):
+    """Counters from lead_stats as {dimension: {value: count}}, skipping values that dropped to zero"""
+    conn = conn or get_db_connection()
+    stats = {d: {} for d in STATS_DIMENSIONS}
+    total = 0
+    for row in conn.execute("SELECT dimension, value, count FROM lead_stats WHERE count != 0"):
+        if row["dimension"] == "total":
+            total = row["count"]
+        else:
+            stats.setdefault(row["dimension"], {})[row["value"]] = row["count"]
+    stats["total"] = total
+    return stats
+
+def get_analytics(conn=None):
+    """Dashboard payload: headline funnel counts plus the per-dimension breakdowns"""
+    stats = get_lead_stats(conn)
+    status = stats["status"]
+    sent = status.get("SENT", 0) + status.get("SENT_DRY_RUN", 0)
+    return {
+        "total": stats["total"],
+        "funnel": {
+            "total": stats["total"],
+            "enriched": stats["total"] - status.get("NEW", 0),
+            "messaged": status.get("MESSAGED", 0) + sent,
+            "sent": sent,
+            "failed": status.get("FAILED", 0)
+        },
+        **{d: stats[d] for d in STATS_DIMENSIONS}
+    }
+
+def select_leads_sql(columns, where="", alias="l", with_rowid=False):
+    """
+    Builds a SELECT over leads for the given columns.
+    Payload columns are joined in from their side table (falling back to the
+    inline column), so callers read the same shape whichever storage is used.
+    """
+    select = [f"{alias}.rowid AS _rowid"] if with_rowid else []
+    joins = {}
+    for col in columns:
+        table = PAYLOAD_TABLES.get(col)
+        if table:
+            side = PAYLOAD_ALIASES[table]
+            joins[table] = f"LEFT JOIN {table} {side} ON {side}.lead_id = {alias}.id"
+            select.append(f"COALESCE({side}.{col}, {alias}.{col}) AS {col}")
+        else:
+            select.append(f"{alias}.{col} AS {col}")
+
+    sql = f"SELECT {', '.join(select)} FROM leads {alias} " + " ".join(joins.values())
+    if where:
+        sql += f" WHERE {where}"
+    return sql
+
+def count_leads(where="", params=(), conn=None):
+    conn = conn or get_db_connection()
+    sql = "SELECT COUNT(*) FROM leads l" + (f" WHERE {where}" if where else "")
+    return conn.execute(sql, params).fetchone()[0]
+
+def iter_lead_batches(columns, where="", params=(), batch_size=STREAM_BATCH_SIZE, conn=None):
+    """
+    Streams leads matching `where` in rowid order, `batch_size` rows at a time.
+    Uses keyset pagination (rowid > last seen), so each page is an index seek
+    and rows updated out of the filter by the caller do not shift later pages.
+    Yields lists of sqlite3.Row; callers commit their writes once per batch.
+    """
+    conn = conn or get_db_connection()
+    keyset = f"({where}) AND l.rowid > ?" if where else "l.rowid > ?"
+    sql = select_leads_sql(columns, keyset, with_rowid=True) + " ORDER BY l.rowid LIMIT ?"
+
+    last_rowid = 0
+    while True:
+        rows = conn.execute(sql, (*params, last_rowid, batch_size)).fetchall()
+        if not rows:
+            return
+        last_rowid = rows[-1]["_rowid"]
+        yield rows
+
+# Browsing: every filter and sort column is indexed, so a page is one index seek
+FILTER_COLUMNS = ["status", "industry", "persona", "country"]
+SORT_COLUMNS = ["rowid", "full_name", "company_name", "country", "status", "industry", "persona"]
+DEFAULT_PAGE_COLUMNS = [col for col in LEAD_COLUMNS if col not in PAYLOAD_TABLES]
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(sort, order, value, rowid):
+    raw = json.dumps([sort, order, value, rowid]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor, sort, order):
+    try:
+        cursor_sort, cursor_order, value, rowid = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if (cursor_sort, cursor_order) != (sort, order):
+        raise ValueError("Cursor belongs to a different sort order")
+    return value, rowid
+
+def _keyset_after(sort, descending, value, rowid):
+    """
+    WHERE clauses for the rows strictly after (value, rowid) in the page order, as
+    segments that are read one after another. SQLite sorts NULL first ascending and
+    last descending; splitting the NULL run off keeps every segment an index seek
+    instead of an OR that would scan from the start of the index.
+    """
+    if sort == "rowid":
+        return [("l.rowid < ?" if descending else "l.rowid > ?", (rowid,))]
+    col = f"l.{sort}"
+    if value is None:
+        if descending:
+            return [(f"{col} IS NULL AND l.rowid < ?", (rowid,))]
+        return [(f"{col} IS NULL AND l.rowid > ?", (rowid,)), (f"{col} IS NOT NULL", ())]
+    if descending:
+        return [(f"({col}, l.rowid) < (?, ?)", (value, rowid)), (f"{col} IS NULL", ())]
+    return [(f"({col}, l.rowid) > (?, ?)", (value, rowid))]
+
+def page_leads(columns=None, filters=None, sort="rowid", order="asc", cursor=None, limit=PAGE_SIZE, conn=None):
+    """
+    One page of leads with keyset pagination over (sort column, rowid).
+    `filters` maps FILTER_COLUMNS to exact values; `columns` is the projection (id is always included).
+    Returns {"leads": [...], "next_cursor": token or None}. Raises ValueError on bad arguments.
+    """
+    conn = conn or get_db_connection()
+    columns = list(columns or DEFAULT_PAGE_COLUMNS)
+    unknown = [col for col in columns if col not in LEAD_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    if "id" not in columns:
+        columns.insert(0, "id")
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"Cannot sort by {sort!r}; choose one of {', '.join(SORT_COLUMNS)}")
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be 'asc' or 'desc'")
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    descending = order == "desc"
+
+    clauses, params = [], []
+    for col, value in (filters or {}).items():
+        if col not in FILTER_COLUMNS:
+            raise ValueError(f"Cannot filter by {col!r}")
+        if value is not None:
+            clauses.append(f"l.{col} = ?")
+            params.append(value)
+    segments = _keyset_after(sort, descending, *decode_cursor(cursor, sort, order)) if cursor else [(None, ())]
+
+    direction = "DESC" if descending else "ASC"
+    order_by = f"l.rowid {direction}" if sort == "rowid" else f"l.{sort} {direction}, l.rowid {direction}"
+    # The cursor needs the sort value even when it is not part of the projection
+    fetched = columns + [sort] if sort != "rowid" and sort not in columns else columns
+
+    rows = []
+    for keyset, keyset_params in segments:
+        where = " AND ".join(clauses + ([keyset] if keyset else []))
+        sql = select_leads_sql(fetched, where, with_rowid=True) + f" ORDER BY {order_by} LIMIT ?"
+        rows += conn.execute(sql, (*params, *keyset_params, limit + 1 - len(rows))).fetchall()
+        if len(rows) > limit:
+            break
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        value = None if sort == "rowid" else last[sort]
+        next_cursor = encode_cursor(sort, order, value, last["_rowid"])
+    return {"leads": [{col: row[col] for col in columns} for row in rows], "next_cursor": next_cursor}
+
+SEND_EVENT_COLUMNS = ["ts", "lead_id", "channel", "status", "attempt", "latency_ms", "smtp_code", "error", "mode"]
+EVENT_FILTERS = ["lead_id", "channel", "status", "mode"]
+
+@metrics.db_batch("insert_send_events", metrics.cursor_rows)
+def insert_send_events(cursor, rows):
+    cursor.executemany(
+        f"INSERT INTO send_events ({', '.join(SEND_EVENT_COLUMNS)}) VALUES ({', '.join('?' * len(SEND_EVENT_COLUMNS))})",
+        rows
+    )
+
+def query_send_events(filters=None, before_id=None, since=None, limit=PAGE_SIZE, conn=None):
+    """
+    Newest-first page of send events. Filters are exact matches on EVENT_FILTERS;
+    pass the returned next_before as `before_id` for the following page.
+    """
+    conn = conn or get_db_connection()
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    clauses, params = [], []
+    for col, value in (filters or {}).items():
+        if col not in EVENT_FILTERS:
+            raise ValueError(f"Cannot filter events by {col!r}")
+        if value is not None:
+            clauses.append(f"{col} = ?")
+            params.append(value)
+    if before_id is not None:
+        clauses.append("id < ?")
+        params.append(int(before_id))
+    if since is not None:
+        clauses.append("ts >= ?")
+        params.append(since)
+
+    sql = f"SELECT id, {', '.join(SEND_EVENT_COLUMNS)} FROM send_events"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    rows = [dict(row) for row in conn.execute(sql + " ORDER BY id DESC LIMIT ?", (*params, limit + 1))]
+    next_before = rows[limit - 1]["id"] if len(rows) > limit else None
+    return {"events": rows[:limit], "next_before": next_before}
+
+def send_event_summary(since, conn=None):
+    """Outcome counts and latency per channel/status since `since` (unix seconds), read through the ts index"""
+    conn = conn or get_db_connection()
+    summary = []
+    for row in conn.execute('''
+        SELECT channel, status, COUNT(*) AS count, AVG(latency_ms) AS avg_latency_ms,
+               MAX(latency_ms) AS max_latency_ms, AVG(attempt) AS avg_attempts
+        FROM send_events WHERE ts >= ? GROUP BY channel, status ORDER BY channel, status
+    ''', (since,)):
+        item = dict(row)
+        for key in ("avg_latency_ms", "max_latency_ms", "avg_attempts"):
+            item[key] = round(item[key], 2) if item[key] is not None else None
+        summary.append(item)
+    codes = {
+        str(row[0]): row[1] for row in conn.execute(
+            "SELECT smtp_code, COUNT(*) FROM send_events WHERE ts >= ? AND smtp_code IS NOT NULL GROUP BY smtp_code",
+            (since,)
+        )
+    }
+    return {"since": since, "outcomes": summary, "smtp_codes": codes}
+
+def new_worker_id(stage="worker"):
+    return f"{stage}:{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+@metrics.db_batch("claim", metrics.returned_rows, phase="db_read")
+def claim_leads(status, worker_id, limit, columns, lease_seconds=LEASE_SECONDS, conn=None):
+    """
+    Atomically leases up to `limit` unclaimed (or lease-expired) leads in `status`
+    to `worker_id` and returns them. Other workers skip leased rows until the
+    lease expires, so a crashed worker's rows are picked up again automatically.
+    Leads marked as duplicates (duplicate_of set) are never claimed.
+    """
+    conn = conn or get_db_connection()
+    now = time.time()
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        claimed = conn.execute('''
+            UPDATE leads SET claimed_by=?, lease_expires=?
+            WHERE rowid IN (
+                SELECT rowid FROM leads
+                WHERE status=? AND duplicate_of IS NULL AND (lease_expires IS NULL OR lease_expires < ?)
+                ORDER BY rowid LIMIT ?
+            )
+            RETURNING rowid
+        ''', (worker_id, now + lease_seconds, status, now, limit)).fetchall()
+
+        rows = _select_claimed(conn, claimed, columns)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return rows
+
+@metrics.db_batch("claim", metrics.returned_rows, phase="db_read")
+def claim_lead_ids(lead_ids, status, worker_id, columns, lease_seconds=LEASE_SECONDS, conn=None):
+    """
+    Like claim_leads, but for specific leads (used by the streaming pipeline to
+    hand leads from one stage to the next without re-scanning by status).
+    Leads no longer in `status`, leased to someone else or marked duplicate are skipped.
+    """
+    conn = conn or get_db_connection()
+    now = time.time()
+    placeholders = ", ".join("?" * len(lead_ids))
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        claimed = conn.execute(f'''
+            UPDATE leads SET claimed_by=?, lease_expires=?
+            WHERE id IN ({placeholders})
+              AND status=? AND duplicate_of IS NULL AND (lease_expires IS NULL OR lease_expires < ?)
+            RETURNING rowid
+        ''', (worker_id, now + lease_seconds, *lead_ids, status, now)).fetchall()
+
+        rows = _select_claimed(conn, claimed, columns)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return rows
+
+def _select_claimed(conn, claimed, columns):
+    if not claimed:
+        return []
+    rowids = [row[0] for row in claimed]
+    placeholders = ", ".join("?" * len(rowids))
+    return conn.execute(
+        select_leads_sql(columns, f"l.rowid IN ({placeholders})") + " ORDER BY l.rowid",
+        rowids
+    ).fetchall()
+
+def release_leads(worker_id, lead_ids=None, conn=None):
+    """Gives leased leads back without changing their status"""
+    conn = conn or get_db_connection()
+    if lead_ids is None:
+        conn.execute("UPDATE leads SET claimed_by=NULL, lease_expires=NULL WHERE claimed_by=?", (worker_id,))
+    else:
+        conn.executemany(
+            "UPDATE leads SET claimed_by=NULL, lease_expires=NULL WHERE id=? AND claimed_by=?",
+            [(lead_id, worker_id) for lead_id in lead_ids]
+        )
+    conn.commit()
+
+def iter_claimed_batches(status, columns, worker_id, batch_size=STREAM_BATCH_SIZE, lease_seconds=LEASE_SECONDS, conn=None):
+    """
+    Claims and yields batches of leads until none are left in `status`.
+    The caller moves each lead out of `status` (the update helpers below also
+    clear the lease). If the generator is closed early or the caller fails,
+    uncommitted work is rolled back and leads still leased to this worker are released.
+    """
+    conn = conn or get_db_connection()
+    try:
+        while True:
+            rows = claim_leads(status, worker_id, batch_size, columns, lease_seconds, conn)
+            if not rows:
+                return
+            yield rows
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        release_leads(worker_id, conn=conn)
+        raise
+
+def _claim_guard(worker_id):
+    """Only touch rows still leased to `worker_id` (a lost lease means another worker owns them)"""
+    return " AND claimed_by=?" if worker_id else ""
+
+def _with_worker(rows, worker_id):
+    return [(*row, worker_id) for row in rows] if worker_id else rows
+
+def _write_side_rows(cursor, table, columns, rows, worker_id):
+    """
+    INSERT OR REPLACE of side-table payloads (first column lead_id). With `worker_id` only leads
+    still leased to it are written, so call it before the guarded UPDATE clears the lease.
+    """
+    placeholders = ", ".join("?" * len(columns))
+    sql = f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+    if not worker_id:
+        cursor.executemany(sql + f"VALUES ({placeholders})", rows)
+        return
+    cursor.executemany(
+        sql + f"SELECT {placeholders} WHERE EXISTS (SELECT 1 FROM leads WHERE id=? AND claimed_by=?)",
+        [(*row, row[0], worker_id) for row in rows]
+    )
+
+@metrics.db_batch("update_enrichment", metrics.cursor_rows)
+def update_enrichment(cursor, rows, worker_id=None):
+    """
+    rows: (pain_points_json, triggers_json, company_size, persona, confidence, lead_id)
+    Marks each lead ENRICHED, clears its lease and stores its JSON payload inline or in lead_enrichment.
+    """
+    if not SIDE_TABLE_PAYLOADS:
+        cursor.executemany('''
+            UPDATE leads 
+            SET pain_points=?, 
+                buying_triggers=?, 
+                company_size=?, 
+                persona=?, 
+                confidence_score=?, 
+                status='ENRICHED',
+                claimed_by=NULL,
+                lease_expires=NULL
+            WHERE id=?''' + _claim_guard(worker_id), _with_worker(rows, worker_id))
+        return
+
+    rows = list(rows)
+    _write_side_rows(
+        cursor, "lead_enrichment", ("lead_id", "pain_points", "buying_triggers"),
+        [(lead_id, pain_points, triggers) for pain_points, triggers, _, _, _, lead_id in rows], worker_id
+    )
+    cursor.executemany('''
+        UPDATE leads 
+        SET pain_points=NULL, 
+            buying_triggers=NULL, 
+            company_size=?, 
+            persona=?, 
+            confidence_score=?, 
+            status='ENRICHED',
+            claimed_by=NULL,
+            lease_expires=NULL
+        WHERE id=?''' + _claim_guard(worker_id),
+        _with_worker([(size, persona, confidence, lead_id) for _, _, size, persona, confidence, lead_id in rows], worker_id)
+    )
+
+@metrics.db_batch("update_messages", metrics.cursor_rows)
+def update_messages(cursor, rows, worker_id=None):
+    """
+    rows: (messages_json, message_source, lead_id)
+    Marks each lead MESSAGED, clears its lease and stores its messages inline or in lead_messages.
+    """
+    if not SIDE_TABLE_PAYLOADS:
+        cursor.executemany('''
+            UPDATE leads 
+            SET generated_messages=?, message_source=?, status='MESSAGED',
+                claimed_by=NULL, lease_expires=NULL
+            WHERE id=?''' + _claim_guard(worker_id), _with_worker(rows, worker_id))
+        return
+
+    rows = list(rows)
+    _write_side_rows(
+        cursor, "lead_messages", ("lead_id", "generated_messages"),
+        [(lead_id, msg_json) for msg_json, _, lead_id in rows], worker_id
+    )
+    cursor.executemany(
+        "UPDATE leads SET generated_messages=NULL, message_source=?, status='MESSAGED', "
+        "claimed_by=NULL, lease_expires=NULL WHERE id=?" + _claim_guard(worker_id),
+        _with_worker([(source, lead_id) for _, source, lead_id in rows], worker_id)
+    )
+
+@metrics.db_batch("update_status", metrics.cursor_rows)
+def update_status(cursor, rows, worker_id=None):
+    """rows: (status, lead_id). Sets the final status and clears the lease."""
+    cursor.executemany(
+        "UPDATE leads SET status=?, claimed_by=NULL, lease_expires=NULL WHERE id=?" + _claim_guard(worker_id),
+        _with_worker(rows, worker_id)
+    )
+
+def move_payloads_to_side_tables(conn):
+    """One-off migration of existing inline JSON columns into the side tables"""
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    c.execute('''
+        INSERT OR REPLACE INTO lead_enrichment (lead_id, pain_points, buying_triggers)
+        SELECT id, pain_points, buying_triggers FROM leads
+        WHERE pain_points IS NOT NULL OR buying_triggers IS NOT NULL
+    ''')
+    moved_enrichment = c.rowcount
+    c.execute('''
+        INSERT OR REPLACE INTO lead_messages (lead_id, generated_messages)
+        SELECT id, generated_messages FROM leads WHERE generated_messages IS NOT NULL
+    ''')
+    moved_messages = c.rowcount
+    c.execute('''
+        UPDATE leads SET pain_points=NULL, buying_triggers=NULL, generated_messages=NULL
+        WHERE pain_points IS NOT NULL OR buying_triggers IS NOT NULL OR generated_messages IS NOT NULL
+    ''')
+    conn.commit()
+    return moved_enrichment, moved_messages
 
 def row_to_dict(row):
     return dict(row)
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    init_db()
+    if "--move-payloads" in sys.argv:
+        enrichment, messages = move_payloads_to_side_tables(get_db_connection())
+        print(f"Moved {enrichment} enrichment and {messages} message payloads into side tables.")
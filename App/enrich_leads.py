@@ -1,147 +1,363 @@
+import asyncio
+import functools
+import itertools
 import json
 import random
-import time
 import os
 import database
+from concurrent.futures import ThreadPoolExecutor
+import llm_cache
+import profiling
+import rules
+from rate_limit import TokenBucket
+from llm_client import wrap, client
 from dotenv import load_dotenv
 
 load_dotenv()
 
-try:
-    from groq import Groq
-    GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-    client = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
-except ImportError:
-    client = None
+PERSONA_RULES = rules.load_rules("personas")
 
 def determine_offline_persona(role):
-    """Determine persona based on role keywords (Offline fallback)"""
-    role_lower = role.lower()
-    
-    if any(x in role_lower for x in ['cto', 'engineering', 'tech', 'developer', 'data', 'architect']):
-        return "Technical Decision Maker"
-    elif any(x in role_lower for x in ['cfo', 'finance', 'treasurer', 'audit']):
-        return "Financial Buyer"
-    elif any(x in role_lower for x in ['ceo', 'founder', 'president', 'owner']):
-        return "Executive Decision Maker"
-    elif any(x in role_lower for x in ['marketing', 'cmo', 'brand']):
-        return "Marketing Lead"
-    elif any(x in role_lower for x in ['hr', 'people', 'talent']):
-        return "HR Decision Maker"
-    elif any(x in role_lower for x in ['manager', 'head', 'director', 'lead']):
-        return "Department Head"
-    else:
-        return "Key Influencer"
-
-def enrich_data(mode="offline"):
+    """Determine persona based on role keywords (Offline fallback). Rules live in rules.json."""
+    return PERSONA_RULES.classify(role)
+
+MODEL_NAME = "llama-3.3-70b-versatile"
+AI_CONCURRENCY = int(os.getenv("ENRICH_CONCURRENCY", "8"))
+AI_REQUESTS_PER_MINUTE = int(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30"))
+AI_PROMPT_BATCH = int(os.getenv("ENRICH_PROMPT_BATCH", "1"))  # leads packed into one request; 1 = one prompt per lead
+
+BATCH_SIZE = int(os.getenv("ENRICH_BATCH_SIZE", "5000"))
+COMPANY_SIZES = ["Mid-Market", "Enterprise", "Startup"]
+
+INDUSTRY_INSIGHTS = {
+    "Technology": (
+        ["Technical debt slowing down release cycles", "High cloud infrastructure costs"],
+        ["Recent CTO hire", "Expanding engineering team"]
+    ),
+    "Healthcare": (
+        ["HIPAA compliance data silos", "Manual patient record processing"],
+        ["New hospital wing opening", "Digitization initiative"]
+    ),
+    "Finance": (
+        ["Slow manual reconciliation processes", "Regulatory reporting errors"],
+        ["Quarterly audit approaching", "Market expansion news"]
+    ),
+    "Retail": (
+        ["Inventory mismanagement", "Low customer retention rates"],
+        ["Opening new store locations", "Holiday season approaching"]
+    ),
+    "Manufacturing": (
+        ["Supply chain disruptions", "Machine downtime impacting yield"],
+        ["New factory launch", "Sustainability mandate"]
+    )
+}
+DEFAULT_INSIGHTS = (
+    ["Operational inefficiencies", "Need for automation"],
+    ["New leadership", "Cost cutting mandate"]
+)
+
+# Pre-serialized JSON columns, so batch writes skip json.dumps per row
+INSIGHTS_JSON = {
+    industry: (json.dumps(pain_points), json.dumps(triggers))
+    for industry, (pain_points, triggers) in INDUSTRY_INSIGHTS.items()
+}
+DEFAULT_INSIGHTS_JSON = (json.dumps(DEFAULT_INSIGHTS[0]), json.dumps(DEFAULT_INSIGHTS[1]))
+
+def offline_insights(industry):
+    """Rule-based pain points and buying triggers for an industry"""
+    pain_points, triggers = INDUSTRY_INSIGHTS.get(industry, DEFAULT_INSIGHTS)
+    return list(pain_points), list(triggers)
+
+def build_ai_prompt(role, industry, company):
+    return f"""
+                Analyze this lead: Role: {role}, Industry: {industry}, Company: {company}.
+                Return a valid JSON object with:
+                - pain_points (list of 2 specific business challenges)
+                - buying_triggers (list of 2 recent events indicating need)
+                - persona (string, e.g., 'Technical Decision Maker', 'Financial Buyer', 'Operational Lead')
+                """
+
+def build_batch_prompt(leads):
+    """
+    One JSON-mode prompt for several leads. Leads are referenced by short keys
+    ("L1", "L2", ...) rather than UUIDs to keep the prompt and answer small.
+    """
+    items = [
+        {"key": f"L{i}", "role": lead['role'], "industry": lead['industry'], "company": lead['company_name']}
+        for i, lead in enumerate(leads, 1)
+    ]
+    return f"""
+                Analyze each lead below.
+                Return a valid JSON object {{"leads": [...]}} with one entry per lead, each with:
+                - key (the lead's key, unchanged)
+                - pain_points (list of 2 specific business challenges)
+                - buying_triggers (list of 2 recent events indicating need)
+                - persona (string, e.g., 'Technical Decision Maker', 'Financial Buyer', 'Operational Lead')
+                Leads: {json.dumps(items)}
+                """
+
+def _string_list(value):
+    return isinstance(value, list) and all(isinstance(v, str) and v.strip() for v in value)
+
+def parse_batch_response(content, leads):
+    """
+    Maps a batched answer back to leads. Returns {lead_id: (pain_points, triggers, persona)}
+    for the well-formed items only; missing or malformed leads are left out for a retry.
+    """
+    try:
+        items = json.loads(content).get("leads", [])
+    except (AttributeError, TypeError, ValueError):
+        return {}
+
+    by_key = {f"L{i}": lead for i, lead in enumerate(leads, 1)}
+    results = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        lead = by_key.get(item.get("key"))
+        pain_points = item.get("pain_points")
+        triggers = item.get("buying_triggers")
+        if lead is None or not pain_points or not _string_list(pain_points) or not _string_list(triggers):
+            continue
+        persona = item.get("persona")
+        if not isinstance(persona, str) or not persona.strip():
+            persona = determine_offline_persona(lead['role'])
+        results[lead['id']] = (pain_points, triggers, persona)
+    return results
+
+def save_enrichment(cursor, lead_id, pain_points, triggers, company_size, persona, confidence, worker_id=None):
+    database.update_enrichment(cursor, [(
+        json.dumps(pain_points), 
+        json.dumps(triggers), 
+        company_size, 
+        persona, 
+        confidence, 
+        lead_id
+    )], worker_id)
+
+async def call_llm(llm, prompt, executor=None, bucket=None):
+    """
+    Runs one JSON-mode completion through a wrapped client (see llm_client.wrap).
+    Async clients are awaited, sync clients run on `executor`. `bucket` is only
+    spent on real provider attempts, not on cache hits or while the breaker is open.
+    """
+    create = llm.chat.completions.create
+    kwargs = {
+        "messages": [{"role": "user", "content": prompt}],
+        "model": MODEL_NAME,
+        "response_format": {"type": "json_object"},
+        "rate_limiter": bucket
+    }
+    with profiling.span("llm"):
+        if asyncio.iscoroutinefunction(create):
+            return await create(**kwargs)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(create, **kwargs))
+
+async def enrich_lead_ai(lead, llm, bucket, executor=None):
+    """Enriches one lead through the LLM, falling back to offline rules for this lead only"""
+    persona = determine_offline_persona(lead['role'])
+    pain_points = []
+    triggers = []
+
+    try:
+        prompt = build_ai_prompt(lead['role'], lead['industry'], lead['company_name'])
+        completion = await call_llm(llm, prompt, executor, bucket)
+        data = json.loads(completion.choices[0].message.content)
+
+        pain_points = data.get("pain_points", [])
+        triggers = data.get("buying_triggers", [])
+        if "persona" in data and data["persona"]:
+            persona = data["persona"]
+
+        print(f"AI Enriched: {lead['full_name']} ({persona})")
+    except Exception as e:
+        print(f"AI Failed for {lead['full_name']} ({e}), falling back to Offline rules.")
+
+    if not pain_points:
+        pain_points, triggers = offline_insights(lead['industry'])
+
+    return pain_points, triggers, persona
+
+async def enrich_leads_ai_batch(leads, llm, bucket, executor=None, slots=None):
+    """
+    Enriches several leads with one request. Leads missing from the answer (or malformed)
+    go through enrich_lead_ai one by one. Returns {lead_id: (pain_points, triggers, persona)}.
+    Every request holds one of `slots` (a semaphore shared by all callers; one at a time if omitted).
+    """
+    slots = slots or asyncio.Semaphore(1)
+    results = {}
+    try:
+        async with slots:
+            completion = await call_llm(llm, build_batch_prompt(leads), executor, bucket)
+        results = parse_batch_response(completion.choices[0].message.content, leads)
+        print(f"AI Batch Enriched: {len(results)}/{len(leads)} leads")
+    except Exception as e:
+        print(f"AI Batch Failed for {len(leads)} leads ({e}), retrying one by one.")
+
+    retry = [lead for lead in leads if lead['id'] not in results]
+    if retry:
+        async def retry_one(lead):
+            async with slots:
+                return await enrich_lead_ai(lead, llm, bucket, executor)
+
+        answers = await asyncio.gather(*(retry_one(lead) for lead in retry))
+        results.update((lead['id'], answer) for lead, answer in zip(retry, answers))
+    return results
+
+ENRICH_COLUMNS = ["id", "full_name", "company_name", "role", "industry"]
+
+async def enrich_data_async(rows, llm, conn, concurrency=AI_CONCURRENCY, requests_per_minute=AI_REQUESTS_PER_MINUTE, worker_id=None, job=None, bucket=None,
+                            prompt_batch=AI_PROMPT_BATCH):
+    """
+    Enriches `rows` (any iterable, e.g. a streamed generator) with at most
+    `concurrency` LLM calls in flight. Requests are paced by a token bucket
+    and every lead is committed as soon as it finishes.
+    With `prompt_batch` > 1 each request covers that many leads (committed together).
+    Pass `bucket` to share one rate limit across several calls.
+    """
+    llm = wrap(llm)
+    bucket = bucket or TokenBucket.per_minute(requests_per_minute)
+    cursor = conn.cursor()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    slots = asyncio.Semaphore(concurrency)
+    pending = iter(rows)
+    done = 0
+
+    async def batch_worker():
+        nonlocal done
+        while True:
+            leads = list(itertools.islice(pending, prompt_batch))
+            if not leads:
+                return
+            results = await enrich_leads_ai_batch(leads, llm, bucket, executor, slots)
+
+            for lead in leads:
+                pain_points, triggers, persona = results[lead['id']]
+                company_size = random.choice(COMPANY_SIZES)
+                confidence = random.randint(75, 98)
+                save_enrichment(cursor, lead['id'], pain_points, triggers, company_size, persona, confidence, worker_id)
+            conn.commit()
+            done += len(leads)
+            if job:
+                job.advance(len(leads))
+                job.check_cancelled()
+
+    async def worker():
+        nonlocal done
+        for lead in pending:
+            pain_points, triggers, persona = await enrich_lead_ai(lead, llm, bucket, executor)
+
+            company_size = random.choice(COMPANY_SIZES)
+            confidence = random.randint(75, 98)
+            save_enrichment(cursor, lead['id'], pain_points, triggers, company_size, persona, confidence, worker_id)
+            conn.commit()
+            done += 1
+            if job:
+                job.advance()
+                job.check_cancelled()
+
+    try:
+        workers = batch_worker if prompt_batch > 1 else worker
+        await asyncio.gather(*(workers() for _ in range(concurrency)))
+    finally:
+        executor.shutdown(wait=False)
+
+    return done
+
+def enrich_batch(leads):
+    """
+    Offline enrichment for a whole chunk of leads.
+    Returns UPDATE parameter tuples ready for executemany.
+    """
+    with profiling.span("classify"):
+        count = len(leads)
+        sizes = random.choices(COMPANY_SIZES, k=count)
+        confidences = [random.randint(75, 98) for _ in range(count)]
+
+        params = []
+        for lead, company_size, confidence in zip(leads, sizes, confidences):
+            pain_points, triggers = INSIGHTS_JSON.get(lead['industry'], DEFAULT_INSIGHTS_JSON)
+            persona = determine_offline_persona(lead['role'] or "")
+            params.append((pain_points, triggers, company_size, persona, confidence, lead['id']))
+        return params
+
+def enrich_data(mode="offline", llm_client=None, concurrency=None, requests_per_minute=None, batch_size=None, worker_id=None, job=None, use_cache=True,
+                prompt_batch=None):
     print(f"Starting Enrichment (Mode: {mode})...")
     
     conn = database.get_db_connection()
-    cursor = conn.cursor()
+    total = database.count_leads("l.status='NEW' AND l.duplicate_of IS NULL", conn=conn)
     
-    cursor.execute("SELECT * FROM leads WHERE status='NEW'")
-    rows = cursor.fetchall()
-    
-    if not rows:
+    if not total:
         print("No NEW leads found to enrich.")
         conn.close()
         return
 
-    print(f"Processing {len(rows)} leads...")
-    
-    for row in rows:
-        lead = dict(row)
-        lead_id = lead['id']
-        industry = lead['industry']
-        role = lead['role']
-        company = lead['company_name']
-        
-        pain_points = []
-        triggers = []
-        
-        persona = determine_offline_persona(role)
-        
-        company_size = random.choice(["Mid-Market", "Enterprise", "Startup"])
-        confidence = random.randint(75, 98)
-
-        if mode == "ai" and client:
-            try:
-                prompt = f"""
-                Analyze this lead: Role: {role}, Industry: {industry}, Company: {company}.
-                Return a valid JSON object with:
-                - pain_points (list of 2 specific business challenges)
-                - buying_triggers (list of 2 recent events indicating need)
-                - persona (string, e.g., 'Technical Decision Maker', 'Financial Buyer', 'Operational Lead')
-                """
-                completion = client.chat.completions.create(
-                    messages=[{"role": "user", "content": prompt}],
-                    model="llama-3.3-70b-versatile",
-                    response_format={"type": "json_object"}
-                )
-                
-                data = json.loads(completion.choices[0].message.content)
-                
-                pain_points = data.get("pain_points", [])
-                triggers = data.get("buying_triggers", [])
-                
-                
-                if "persona" in data and data["persona"]:
-                    persona = data["persona"]
-                    
-                print(f"AI Enriched: {lead['full_name']} ({persona})")
-                time.sleep(1) 
-                
-            except Exception as e:
-                print(f"AI Failed ({e}), falling back to Offline rules.")
-                mode = "offline" 
-
-        if not pain_points:
-        
-            
-            if industry == "Technology":
-                pain_points = ["Technical debt slowing down release cycles", "High cloud infrastructure costs"]
-                triggers = ["Recent CTO hire", "Expanding engineering team"]
-            elif industry == "Healthcare":
-                pain_points = ["HIPAA compliance data silos", "Manual patient record processing"]
-                triggers = ["New hospital wing opening", "Digitization initiative"]
-            elif industry == "Finance":
-                pain_points = ["Slow manual reconciliation processes", "Regulatory reporting errors"]
-                triggers = ["Quarterly audit approaching", "Market expansion news"]
-            elif industry == "Retail":
-                pain_points = ["Inventory mismanagement", "Low customer retention rates"]
-                triggers = ["Opening new store locations", "Holiday season approaching"]
-            elif industry == "Manufacturing":
-                pain_points = ["Supply chain disruptions", "Machine downtime impacting yield"]
-                triggers = ["New factory launch", "Sustainability mandate"]
-            else:
-                pain_points = ["Operational inefficiencies", "Need for automation"]
-                triggers = ["New leadership", "Cost cutting mandate"]
-            
-            print(f"Offline Enriched: {lead['full_name']} ({persona})")
-            time.sleep(0.1)
-
-
-        cursor.execute('''
-            UPDATE leads 
-            SET pain_points=?, 
-                buying_triggers=?, 
-                company_size=?, 
-                persona=?, 
-                confidence_score=?, 
-                status='ENRICHED'
-            WHERE id=?
-        ''', (
-            json.dumps(pain_points), 
-            json.dumps(triggers), 
-            company_size, 
-            persona, 
-            confidence, 
-            lead_id
-        ))
-
-    conn.commit()
-    conn.close()
+    print(f"Processing {total} leads...")
+    if job:
+        job.set_total(total)
+
+    llm = wrap(llm_client or client, use_cache=use_cache)
+    use_ai = mode == "ai" and llm
+    concurrency = concurrency or AI_CONCURRENCY
+    prompt_batch = prompt_batch or AI_PROMPT_BATCH
+    if not batch_size:
+        # AI claims stay small so leased-but-waiting leads do not outlive their lease
+        batch_size = concurrency * 4 * prompt_batch if use_ai else BATCH_SIZE if mode == "batch" else database.STREAM_BATCH_SIZE
+
+    worker_id = worker_id or database.new_worker_id("enrich")
+    batches = database.iter_claimed_batches("NEW", ENRICH_COLUMNS, worker_id, batch_size=batch_size, conn=conn)
+
+    try:
+        if use_ai:
+            asyncio.run(enrich_data_async(
+                (lead for batch in batches for lead in batch),
+                llm,
+                conn,
+                concurrency=concurrency,
+                requests_per_minute=requests_per_minute or AI_REQUESTS_PER_MINUTE,
+                worker_id=worker_id,
+                job=job,
+                prompt_batch=prompt_batch
+            ))
+        elif mode == "batch":
+            cursor = conn.cursor()
+            done = 0
+            for leads in batches:
+                database.update_enrichment(cursor, enrich_batch(leads), worker_id)
+                conn.commit()
+                done += len(leads)
+                print(f"Batch Enriched: {done}/{total} leads")
+                if job:
+                    job.advance(len(leads))
+                    job.check_cancelled()
+        else:
+            cursor = conn.cursor()
+            for leads in batches:
+                for lead in leads:
+                    with profiling.span("classify"):
+                        persona = determine_offline_persona(lead['role'])
+                        company_size = random.choice(COMPANY_SIZES)
+                        confidence = random.randint(75, 98)
+
+                        pain_points, triggers = offline_insights(lead['industry'])
+                    print(f"Offline Enriched: {lead['full_name']} ({persona})")
+
+                    save_enrichment(cursor, lead['id'], pain_points, triggers, company_size, persona, confidence, worker_id)
+                conn.commit()
+                if job:
+                    job.advance(len(leads))
+                    job.check_cancelled()
+    finally:
+        batches.close()
+        conn.close()
+
+    if use_ai:
+        stats = llm_cache.cache.stats()
+        print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses (hit rate {stats['hit_rate']:.0%}).")
     print("Enrichment Complete. Status updated to 'ENRICHED'.")
 
 if __name__ == "__main__":
-    enrich_data(mode="offline")
\ No newline at end of file
+    profiling.profile_run(None, "enrich-leads", lambda: enrich_data(mode="offline"))
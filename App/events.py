@@ -0,0 +1,143 @@
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import database
+import metrics
+import outreach_log
+
+# Structured send events. The send loop only builds a SendEvent and puts it on a queue;
+# a background thread writes them to the send_events table in batches and emits the
+# matching human-readable line to the outreach log, so neither write blocks sending.
+
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "500"))
+EVENT_FLUSH_SECONDS = float(os.getenv("EVENT_FLUSH_SECONDS", "0.5"))
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100000"))
+
+SendEvent = namedtuple("SendEvent", database.SEND_EVENT_COLUMNS)
+
+def smtp_code(error):
+    """Reply code carried by an smtplib or smtp_dispatcher exception, if any"""
+    if error is None:
+        return None
+    code = getattr(error, "smtp_code", None) or getattr(error, "code", None)
+    if code is None and getattr(error, "recipients", None):
+        code = next(iter(error.recipients.values()))[0]
+    return code if isinstance(code, int) else None
+
+class EventWriter:
+    """
+    Queue-backed batch writer. record() never touches the disk; when the queue is full
+    it blocks, which slows the producers rather than dropping history.
+    """
+
+    def __init__(self, batch_size=EVENT_BATCH_SIZE, flush_seconds=EVENT_FLUSH_SECONDS, max_queue=EVENT_QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.conn = None
+        self.conn_path = None
+        self.logger = outreach_log.get_logger()
+        self.counters = {"written": 0, "batches": 0, "failed": 0}
+
+    def _start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+                self.thread.start()
+
+    def record(self, lead_id, channel, status, attempt=1, latency_ms=None, smtp_code=None,
+               error=None, mode=None, message=None):
+        """Queues one event; `message` is the outreach log line written alongside it"""
+        if self.thread is None or not self.thread.is_alive():
+            self._start()
+        event = SendEvent(time.time(), lead_id, channel, status, attempt, latency_ms, smtp_code,
+                          str(error) if error is not None else None, mode)
+        self.queue.put((event, message))
+
+    def flush(self, timeout=30):
+        """Blocks until everything recorded so far is written"""
+        if self.thread is None:
+            return True
+        self._start()
+        marker = threading.Event()
+        self.queue.put(marker)
+        return marker.wait(timeout)
+
+    def _db(self):
+        # Reconnect when database.configure() pointed the process at another file
+        if self.conn is None or self.conn_path != database.manager.path:
+            if self.conn is not None:
+                self.conn.really_close()
+            self.conn = database.manager.connect()
+            self.conn_path = database.manager.path
+            database.migrate(self.conn)
+        return self.conn
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            batch, markers = [], []
+            deadline = time.monotonic() + self.flush_seconds
+            while True:
+                if isinstance(item, threading.Event):
+                    markers.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    self._write(batch)
+            except Exception as e:
+                # Keep the writer alive: a dead thread would block every producer on a full queue
+                print(f"Send event writer error ({type(e).__name__}: {e}).")
+            finally:
+                for marker in markers:
+                    marker.set()
+
+    def _write(self, batch):
+        try:
+            conn = self._db()
+            database.insert_send_events(conn.cursor(), [event for event, _ in batch])
+            conn.commit()
+            self.counters["written"] += len(batch)
+            self.counters["batches"] += 1
+        except Exception as e:
+            self.counters["failed"] += len(batch)
+            print(f"Send event write failed ({e}), dropped {len(batch)} events.")
+            try:
+                self.conn.rollback()
+            except (sqlite3.Error, AttributeError):
+                pass
+
+        for event, message in batch:
+            if message:
+                # Stamp the line with the send time, not the (later) write time
+                level = logging.ERROR if event.status == "FAILED" else logging.INFO
+                log_record = self.logger.makeRecord(self.logger.name, level, __file__, 0, message, None, None)
+                log_record.created = event.ts
+                log_record.msecs = (event.ts % 1) * 1000
+                self.logger.handle(log_record)
+
+    def stats(self):
+        return {**self.counters, "queued": self.queue.qsize()}
+
+writer = EventWriter()
+record = writer.record
+flush = writer.flush
+
+QUEUE_DEPTH = metrics.Gauge("leadgen_event_queue_depth", "Send events waiting for the batch writer", function=writer.queue.qsize)
+
+atexit.register(writer.flush, 5)
@@ -0,0 +1,137 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+import database
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Streaming lead export. Rows are read in keyset batches on a dedicated connection
+# and serialized batch by batch, so memory stays constant whatever the table size
+# and the first bytes go out as soon as the first batch is read.
+
+EXPORT_BATCH_SIZE = database.STREAM_BATCH_SIZE
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    "parquet": ("application/vnd.apache.parquet", "parquet")
+}
+
+NUMERIC_COLUMNS = {"confidence_score": "int64", "created_at": "float64"}
+
+def parse_time(value):
+    """ISO date or datetime (naive values are UTC) -> unix seconds"""
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date {value!r}; use ISO format such as 2024-05-01 or 2024-05-01T12:00:00")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def build_filter(status=None, since=None, until=None):
+    """WHERE clause and params for the export filters; `until` is exclusive"""
+    clauses, params = [], []
+    if status:
+        statuses = [s.strip() for s in status.split(",") if s.strip()]
+        clauses.append(f"l.status IN ({', '.join('?' * len(statuses))})")
+        params.extend(statuses)
+    if since:
+        clauses.append("l.created_at >= ?")
+        params.append(parse_time(since))
+    if until:
+        clauses.append("l.created_at < ?")
+        params.append(parse_time(until))
+    return " AND ".join(clauses), tuple(params)
+
+def resolve_columns(columns=None):
+    columns = list(columns or database.LEAD_COLUMNS)
+    unknown = [col for col in columns if col not in database.LEAD_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    return columns
+
+def iter_batches(columns, where="", params=(), batch_size=EXPORT_BATCH_SIZE):
+    """
+    Lead batches from a connection of its own. The web server may resume the generator
+    on a different worker thread, so it must not borrow that thread's pooled connection.
+    """
+    conn = database.manager.connect()
+    try:
+        for rows in database.iter_lead_batches(columns, where, params, batch_size=batch_size, conn=conn):
+            yield [tuple(row[col] for col in columns) for row in rows]
+    finally:
+        conn.close()
+        conn.really_close()
+
+def iter_csv(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+def iter_jsonl(columns, batches):
+    for rows in batches:
+        yield "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in rows).encode("utf-8")
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last drain()"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def iter_parquet(columns, batches):
+    """One Parquet row group per batch; the footer is written when the last batch is done"""
+    schema = pa.schema([(col, getattr(pa, NUMERIC_COLUMNS.get(col, "string"))()) for col in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in batches:
+            arrays = [pa.array([row[i] for row in rows], type=schema.field(i).type) for i in range(len(columns))]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+SERIALIZERS = {"csv": iter_csv, "jsonl": iter_jsonl, "parquet": iter_parquet}
+
+def stream(fmt, columns=None, status=None, since=None, until=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Validates the request and returns (byte chunk iterator, media type, file extension).
+    Raises ValueError for bad arguments and RuntimeError when Parquet is requested without pyarrow.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; choose one of {', '.join(FORMATS)}")
+    if fmt == "parquet" and pa is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    columns = resolve_columns(columns)
+    where, params = build_filter(status, since, until)
+    media_type, extension = FORMATS[fmt]
+    return SERIALIZERS[fmt](columns, iter_batches(columns, where, params, batch_size)), media_type, extension
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+# Local stand-in for the Groq client. It mimics `client.chat.completions.create`
+# so the enrichment and messaging stages can be exercised without network access.
+
+
+class FakeLLMClient:
+    """
+    Sync fake Groq client with configurable latency, jitter and failure rate.
+    `token_latency` adds time per completion token (real latency grows with the answer),
+    `drop_rate` leaves that share of leads out of batched enrichment answers.
+    """
+
+    def __init__(self, latency=0.2, jitter=0.0, failure_rate=0.0, seed=None, token_latency=0.0, drop_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.token_latency = token_latency
+        self.drop_rate = drop_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _respond(self, messages):
+        with self.lock:
+            self.calls += 1
+            failed = self.rng.random() < self.failure_rate
+            completion = build_completion(messages, self.rng, self.drop_rate)
+            self.prompt_tokens += completion.usage.prompt_tokens
+            self.completion_tokens += completion.usage.completion_tokens
+            delay = (self.latency + self.rng.uniform(0, self.jitter)
+                     + self.token_latency * completion.usage.completion_tokens)
+        return delay, failed, completion
+
+    def create(self, messages, model=None, **kwargs):
+        delay, failed, completion = self._respond(messages)
+        time.sleep(delay)
+        if failed:
+            raise RuntimeError("Fake LLM error")
+        return completion
+
+
+class FakeAsyncLLMClient(FakeLLMClient):
+    """Async variant, shaped like `groq.AsyncGroq`."""
+
+    async def create(self, messages, model=None, **kwargs):
+        delay, failed, completion = self._respond(messages)
+        await asyncio.sleep(delay)
+        if failed:
+            raise RuntimeError("Fake LLM error")
+        return completion
+
+
+ENRICHMENT = {
+    "pain_points": ["Manual reporting eats analyst time", "Fragmented customer data"],
+    "buying_triggers": ["New leadership hire", "Budget planning cycle"],
+    "persona": "Operational Lead"
+}
+
+def build_completion(messages, rng=random, drop_rate=0.0):
+    prompt = messages[-1]["content"]
+
+    if "Leads: [" in prompt:
+        # Batched enrichment prompt: answer each listed lead by its key
+        leads = json.loads(prompt[prompt.index("Leads: [") + len("Leads: "):].strip())
+        content = {"leads": [
+            {"key": lead["key"], **ENRICHMENT}
+            for lead in leads if rng.random() >= drop_rate
+        ]}
+    elif "pain_points" in prompt:
+        content = dict(ENRICHMENT)
+    else:
+        content = {
+            "email_variant_1": {"subject": "Quick idea", "body": "Hi there, are you free for a 15-min call?"},
+            "email_variant_2": {"subject": "Following up", "body": "Hi again, are you free for a 15-min call?"},
+            "linkedin_variant_1": "Hi, would love to connect.",
+            "linkedin_variant_2": "Hey, sharing a quick idea on automation."
+        }
+
+    text = json.dumps(content)
+    prompt_tokens = len(prompt) // 4
+    completion_tokens = len(text) // 4
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens
+        )
+    )
@@ -1,10 +1,12 @@
 import faker
 import uuid
 import random
+import os
 import database
+import metrics
 import sys
-
-fake = faker.Faker()
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 INDUSTRY_ROLES = {
     "Technology": ["CTO", "VP of Engineering", "Product Manager", "Head of AI", "DevOps Lead"],
@@ -14,19 +16,55 @@ INDUSTRY_ROLES = {
     "Manufacturing": ["Plant Manager", "Operations Director", "Logistics Head", "Production Supervisor"]
 }
 
-def generate_leads(num_leads):
-    print(f"Generating {num_leads} leads into SQLite Database...")
-    
-    database.init_db()
-    
-    conn = database.get_db_connection()
+SHARD_SIZE = int(os.getenv("LEADGEN_SHARD_SIZE", "10000"))
+
+# A fake email/LinkedIn URL that collides with an existing lead (or an ID from an earlier run
+# with the same seed) is skipped; any other constraint failure still raises
+INSERT_SQL = f'''
+    INSERT INTO leads (
+        id, full_name, company_name, role, industry, 
+        website, email, linkedin_url, country, status, created_at
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, {database.CREATED_AT_SQL})
+    ON CONFLICT (id) DO NOTHING
+    {" ".join(f"ON CONFLICT ({col}) WHERE duplicate_of IS NULL DO NOTHING" for col in database.DEDUPE_COLUMNS)}
+'''
+
+@metrics.db_batch("insert_leads", metrics.cursor_rows)
+def insert_leads(cursor, rows):
+    """Bulk inserts generated rows; returns how many were new"""
+    cursor.executemany(INSERT_SQL, rows)
+    return cursor.rowcount
+
+def insert_new_leads(conn, rows):
+    """Inserts and commits one shard; returns the IDs of the rows actually inserted"""
     cursor = conn.cursor()
-    
-    generated_summary = []
-    
-    for _ in range(num_leads):
-        industry = random.choice(list(INDUSTRY_ROLES.keys()))
-        role = random.choice(INDUSTRY_ROLES[industry])
+    # IMMEDIATE holds the write lock from the start, so every rowid past the current max is ours
+    cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute("SELECT COALESCE(MAX(rowid), 0) FROM leads")
+    last_rowid = cursor.fetchone()[0]
+    insert_leads(cursor, rows)
+    ids = [row[0] for row in cursor.execute("SELECT id FROM leads WHERE rowid > ?", (last_rowid,))]
+    conn.commit()
+    return ids
+
+def shard_seed(seed, shard_index):
+    """Derives a stable per-shard seed, so output does not depend on the worker count"""
+    return random.Random(f"{seed}:{shard_index}").getrandbits(64)
+
+def build_shard(spec):
+    """Builds the lead rows for one shard. Runs in worker processes when workers > 1."""
+    shard_index, count, seed = spec
+    rng = random.Random(seed)
+    # Own Faker per shard: a shared, reseeded instance mixes the streams of concurrent runs
+    fake = faker.Faker()
+    fake.seed_instance(seed)
+    industries = list(INDUSTRY_ROLES.keys())
+
+    rows = []
+    for _ in range(count):
+        industry = rng.choice(industries)
+        role = rng.choice(INDUSTRY_ROLES[industry])
         
         first_name = fake.first_name()
         last_name = fake.last_name()
@@ -36,11 +74,11 @@ def generate_leads(num_leads):
         clean_company = company.replace(' ', '').replace(',', '').replace('.', '').lower()
         website = f"www.{clean_company}.com"
         email = f"{first_name.lower()}.{last_name.lower()}@{clean_company}.com"
-        linkedin_url = f"linkedin.com/in/{first_name.lower()}-{last_name.lower()}-{random.randint(100, 999)}"
+        linkedin_url = f"linkedin.com/in/{first_name.lower()}-{last_name.lower()}-{rng.randint(100, 999)}"
         
-        lead_id = str(uuid.uuid4())
+        lead_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
         
-        lead_data = (
+        rows.append((
             lead_id,
             full_name,
             company,
@@ -51,23 +89,79 @@ def generate_leads(num_leads):
             linkedin_url,
             fake.country(),
             "NEW"
-        )
-        
-        cursor.execute('''
-            INSERT INTO leads (
-                id, full_name, company_name, role, industry, 
-                website, email, linkedin_url, country, status
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', lead_data)
-        
-        generated_summary.append({"id": lead_id, "full_name": full_name, "company": company})
+        ))
+    return rows
 
-    conn.commit()
+def iter_shards(num_leads, seed, workers=1, shard_size=SHARD_SIZE):
+    """
+    Yields the rows of each shard in order.
+    With workers > 1 shards are built in a process pool, keeping at most
+    2 * workers shards in flight so memory stays bounded.
+    """
+    num_shards = (num_leads + shard_size - 1) // shard_size
+    specs = (
+        (i, min(shard_size, num_leads - i * shard_size), shard_seed(seed, i))
+        for i in range(num_shards)
+    )
+
+    if workers <= 1:
+        for spec in specs:
+            yield build_shard(spec)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        for spec in specs:
+            in_flight.append(pool.submit(build_shard, spec))
+            if len(in_flight) >= workers * 2:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+def generate_leads(num_leads, seed=None, workers=1, shard_size=SHARD_SIZE, job=None):
+    """
+    Generates `num_leads` leads and bulk inserts them shard by shard.
+    The same seed always produces the same leads, whatever the worker count.
+    Returns counts and the rowid range of the inserted leads instead of the leads themselves.
+    """
+    print(f"Generating {num_leads} leads into SQLite Database...")
+    
+    database.init_db()
+
+    if seed is None:
+        seed = random.randrange(2**32)
+    
+    conn = database.get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT COALESCE(MAX(rowid), 0) FROM leads")
+    first_rowid = cursor.fetchone()[0] + 1
+    inserted = 0
+    if job:
+        job.set_total(num_leads)
+    
+    shards = iter_shards(num_leads, seed, workers=workers, shard_size=shard_size)
+    try:
+        for rows in shards:
+            inserted += insert_leads(cursor, rows)
+            conn.commit()
+            if job:
+                job.advance(len(rows))
+                job.check_cancelled()
+    finally:
+        shards.close()
+
+    cursor.execute("SELECT COALESCE(MAX(rowid), 0) FROM leads")
+    last_rowid = cursor.fetchone()[0]
     conn.close()
     
-    print(f"Successfully inserted {len(generated_summary)} leads into 'leads.db'.")
-    return generated_summary
+    print(f"Successfully inserted {inserted} leads into '{database.DB_NAME}'.")
+    return {
+        "count": inserted,
+        "seed": seed,
+        "first_rowid": first_rowid if inserted else None,
+        "last_rowid": last_rowid if inserted else None
+    }
 
 if __name__ == "__main__":
-    generate_leads(10)
\ No newline at end of file
+    generate_leads(10)
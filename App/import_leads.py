@@ -0,0 +1,257 @@
+import argparse
+import csv
+import json
+import os
+import uuid
+
+import database
+import metrics
+from validation import EMAIL_RE
+
+# Bulk import of real lead lists (CSV or JSONL). The file is parsed as a stream and
+# written IMPORT_BATCH_SIZE rows per transaction, so memory does not grow with the file.
+# Leads are deduplicated on email and linkedin_url through the unique indexes: a row that
+# matches an existing lead updates it (or is skipped) instead of creating a second one.
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+MAX_REPORTED_REJECTS = int(os.getenv("IMPORT_MAX_REJECTS", "1000"))
+MAX_FIELD_LENGTH = 500
+
+IMPORT_FIELDS = ["full_name", "company_name", "role", "industry", "website", "email", "linkedin_url", "country"]
+UPDATABLE_FIELDS = ["full_name", "company_name", "role", "industry", "website", "country"]
+
+HEADER_ALIASES = {
+    "name": "full_name",
+    "company": "company_name",
+    "organization": "company_name",
+    "title": "role",
+    "job_title": "role",
+    "linkedin": "linkedin_url",
+    "url": "website",
+    "e-mail": "email",
+    "email_address": "email"
+}
+
+ON_DUPLICATE = {
+    "update": ", ".join(f"{f} = COALESCE(excluded.{f}, {f})" for f in UPDATABLE_FIELDS),
+    "skip": None
+}
+
+def upsert_sql(on_duplicate="update"):
+    """INSERT with one ON CONFLICT clause per dedupe index (needs SQLite 3.35+)"""
+    updates = ON_DUPLICATE[on_duplicate]
+    action = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+    conflicts = " ".join(
+        f"ON CONFLICT ({col}) WHERE duplicate_of IS NULL {action}" for col in database.DEDUPE_COLUMNS
+    )
+    return f'''
+        INSERT INTO leads ({", ".join(["id"] + IMPORT_FIELDS)}, status, created_at)
+        VALUES ({", ".join("?" * (len(IMPORT_FIELDS) + 1))}, 'NEW', {database.CREATED_AT_SQL})
+        {conflicts}
+    '''
+
+class RejectedRow(ValueError):
+    pass
+
+def normalize_header(name):
+    key = (name or "").strip().lower().replace(" ", "_")
+    return HEADER_ALIASES.get(key, key)
+
+def normalize_linkedin(url):
+    url = url.lower().split("?")[0].split("#")[0].rstrip("/")
+    for prefix in ("https://", "http://", "www."):
+        if url.startswith(prefix):
+            url = url[len(prefix):]
+    if not url.startswith("linkedin.com/") and ".linkedin.com/" not in url:
+        raise RejectedRow(f"invalid linkedin_url {url!r}")
+    return url[url.index("linkedin.com/"):]
+
+def normalize_record(record):
+    """Validated tuple for upsert_sql, or RejectedRow explaining why the row cannot be imported"""
+    lead = {}
+    for key, value in record.items():
+        field = normalize_header(key)
+        if field in IMPORT_FIELDS or field in ("first_name", "last_name"):
+            value = str(value).strip() if value is not None else ""
+            if len(value) > MAX_FIELD_LENGTH:
+                raise RejectedRow(f"{field} longer than {MAX_FIELD_LENGTH} characters")
+            lead[field] = value or None
+
+    if not lead.get("full_name"):
+        lead["full_name"] = " ".join(p for p in (lead.get("first_name"), lead.get("last_name")) if p) or None
+    if not lead.get("full_name"):
+        raise RejectedRow("full_name is required")
+
+    if lead.get("email"):
+        lead["email"] = lead["email"].lower()
+        if not EMAIL_RE.match(lead["email"]):
+            raise RejectedRow(f"invalid email {lead['email']!r}")
+    if lead.get("linkedin_url"):
+        lead["linkedin_url"] = normalize_linkedin(lead["linkedin_url"])
+    if not lead.get("email") and not lead.get("linkedin_url"):
+        raise RejectedRow("email or linkedin_url is required")
+
+    return (str(uuid.uuid4()), *(lead.get(f) for f in IMPORT_FIELDS))
+
+def detect_format(name, fmt=None):
+    if fmt:
+        fmt = fmt.lower()
+    else:
+        fmt = "jsonl" if os.path.splitext(name or "")[1].lower() in (".jsonl", ".ndjson") else "csv"
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"Unsupported import format {fmt!r}; use csv or jsonl")
+    return fmt
+
+def iter_records(stream, fmt):
+    """Yields (line number, record dict or RejectedRow) from a text stream"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            if None in record:
+                yield reader.line_num, RejectedRow("more fields than the header")
+            else:
+                yield reader.line_num, record
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, RejectedRow(f"invalid JSON ({e})")
+            continue
+        yield line_number, record if isinstance(record, dict) else RejectedRow("not a JSON object")
+
+class ImportReport:
+    def __init__(self, rejects_writer=None):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.rejects = []
+        self.rejects_writer = rejects_writer
+
+    def reject(self, line, error):
+        self.rejected += 1
+        if len(self.rejects) < MAX_REPORTED_REJECTS:
+            self.rejects.append({"line": line, "error": str(error)})
+        if self.rejects_writer:
+            self.rejects_writer.writerow([line, str(error)])
+
+    def as_dict(self):
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "rejected": self.rejected,
+            "rejects": self.rejects,
+            "rejects_truncated": self.rejected > len(self.rejects)
+        }
+
+def _total_leads(cursor):
+    row = cursor.execute("SELECT count FROM lead_stats WHERE dimension='total'").fetchone()
+    return row[0] if row else 0
+
+@metrics.db_batch("import", lambda args, result: len(args[2]))
+def write_batch(conn, sql, rows, on_duplicate, report):
+    """
+    Upserts one batch in a single write transaction. The lead_stats total is read
+    under the same lock before and after, which splits the changes into inserts and updates.
+    """
+    cursor = conn.cursor()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        before = _total_leads(cursor)
+        cursor.executemany(sql, rows)
+        changed = cursor.rowcount
+        inserted = _total_leads(cursor) - before
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    report.inserted += inserted
+    if on_duplicate == "update":
+        report.updated += changed - inserted
+    else:
+        report.skipped += len(rows) - inserted
+
+def import_stream(stream, fmt="csv", on_duplicate="update", batch_size=IMPORT_BATCH_SIZE, rejects_writer=None, job=None):
+    """Imports every record of a text stream; returns the ImportReport as a dict"""
+    if on_duplicate not in ON_DUPLICATE:
+        raise ValueError("on_duplicate must be 'update' or 'skip'")
+    database.init_db()
+    conn = database.get_db_connection()
+    sql = upsert_sql(on_duplicate)
+    report = ImportReport(rejects_writer)
+
+    batch = []
+    try:
+        for line, record in iter_records(stream, fmt):
+            report.rows += 1
+            try:
+                if isinstance(record, RejectedRow):
+                    raise record
+                batch.append(normalize_record(record))
+            except RejectedRow as e:
+                report.reject(line, e)
+
+            if len(batch) >= batch_size:
+                write_batch(conn, sql, batch, on_duplicate, report)
+                if job:
+                    job.advance(len(batch))
+                    job.check_cancelled()
+                batch = []
+        if batch:
+            write_batch(conn, sql, batch, on_duplicate, report)
+            if job:
+                job.advance(len(batch))
+    finally:
+        conn.close()
+    return report.as_dict()
+
+def import_leads(path, fmt=None, on_duplicate="update", batch_size=IMPORT_BATCH_SIZE, rejects_path=None, remove_after=False, job=None):
+    """
+    Imports a CSV or JSONL file (format from `fmt` or the extension).
+    `rejects_path` receives every rejected line as CSV; the returned report lists the first MAX_REPORTED_REJECTS.
+    `remove_after` deletes the file afterwards (used for uploads spooled to a temp file).
+    """
+    fmt = detect_format(path, fmt)
+    print(f"Importing leads from {path} ({fmt})...")
+    rejects_file = open(rejects_path, "w", newline="", encoding="utf-8") if rejects_path else None
+    try:
+        rejects_writer = None
+        if rejects_file:
+            rejects_writer = csv.writer(rejects_file)
+            rejects_writer.writerow(["line", "error"])
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            report = import_stream(f, fmt, on_duplicate, batch_size, rejects_writer, job)
+    finally:
+        if rejects_file:
+            rejects_file.close()
+        if remove_after:
+            os.remove(path)
+
+    print(f"Imported {report['rows']} rows: {report['inserted']} new, {report['updated']} updated, "
+          f"{report['skipped']} skipped, {report['rejected']} rejected.")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import leads from a CSV or JSONL file")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"])
+    parser.add_argument("--skip-duplicates", action="store_true", help="leave existing leads untouched")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--rejects", help="write rejected lines to this CSV file")
+    args = parser.parse_args()
+
+    import_leads(
+        args.path,
+        fmt=args.format,
+        on_duplicate="skip" if args.skip_duplicates else "update",
+        batch_size=args.batch_size,
+        rejects_path=args.rejects
+    )
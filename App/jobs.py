@@ -0,0 +1,243 @@
+import json
+import socket
+import threading
+import time
+import traceback
+import uuid
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import metrics
+import profiling
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+PROGRESS_FLUSH_SECONDS = 1.0
+
+class JobCancelled(Exception):
+    pass
+
+def process_owner():
+    """Owner tag stored on jobs started by this process"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def owner_alive(owner):
+    """False when `owner` is this process (recovering at startup) or a process gone from this host"""
+    if not owner or owner == process_owner():
+        return False
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True  # another host's process cannot be checked from here
+    if os.name == "nt":
+        return True  # signal 0 is CTRL_C_EVENT on Windows, so no probe there
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class Job:
+    """
+    Progress/cancellation handle passed to a stage as `job=`.
+    Stages call set_total() once, advance() after each committed batch and
+    check_cancelled() between batches.
+    """
+
+    def __init__(self, job_id, manager):
+        self.id = job_id
+        self.manager = manager
+        self.kind = None
+        self.profile = None
+        self.cleanup = None
+        self.processed = 0
+        self.total = None
+        self.cancel_event = threading.Event()
+        self.done = threading.Event()
+        self.last_flush = 0.0
+
+    def set_total(self, total):
+        self.total = total
+        self.flush(force=True)
+
+    def advance(self, count=1):
+        self.processed += count
+        self.flush()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled(f"Job {self.id} cancelled")
+
+    def flush(self, force=False):
+        now = time.time()
+        if force or now - self.last_flush >= PROGRESS_FLUSH_SECONDS:
+            self.last_flush = now
+            self.manager.save_progress(self)
+
+class JobManager:
+    """
+    Runs pipeline stages on a bounded worker pool and persists their state in the jobs table.
+    Jobs still QUEUED/RUNNING from a previous API process are marked INTERRUPTED on startup;
+    those of other live processes sharing the database are left alone.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.active = {}
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def _db(self):
+        # Own connection, so progress commits never touch a stage's open transaction
+        if self.conn is None:
+            self.conn = database.manager.connect()
+        return self.conn
+
+    def _execute(self, sql, params=()):
+        with self.lock:
+            conn = self._db()
+            conn.execute(sql, params)
+            conn.commit()
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self._db().execute(sql, params).fetchall()
+
+    def recover(self):
+        rows = self._query("SELECT id, owner FROM jobs WHERE status IN ('QUEUED', 'RUNNING')")
+        orphaned = [(time.time(), row["id"]) for row in rows if not owner_alive(row["owner"])]
+        if not orphaned:
+            return
+        with self.lock:
+            conn = self._db()
+            conn.executemany(
+                "UPDATE jobs SET status='INTERRUPTED', finished_at=? WHERE id=? AND status IN ('QUEUED', 'RUNNING')",
+                orphaned
+            )
+            conn.commit()
+
+    def submit(self, kind, func, params=None, profile=None, cleanup=None):
+        """
+        Queues func(job=..., **params); `profile` (cprofile/sample/off) overrides PROFILE_MODE for this job.
+        `cleanup()` runs once the job ends in any state, including cancelled before it started.
+        """
+        params = params or {}
+        job = Job(uuid.uuid4().hex, self)
+        job.kind = kind
+        job.profile = profile
+        job.cleanup = cleanup
+        self._execute(
+            "INSERT INTO jobs (id, kind, params, status, processed, created_at, owner) VALUES (?, ?, ?, 'QUEUED', 0, ?, ?)",
+            (job.id, kind, json.dumps(params), time.time(), process_owner())
+        )
+        with self.lock:
+            self.active[job.id] = job
+        self.executor.submit(self._run, job, func, params)
+        return job.id
+
+    def _run(self, job, func, params):
+        if job.cancelled:
+            self._finish(job, "CANCELLED")
+            return
+
+        self._execute("UPDATE jobs SET status='RUNNING', started_at=? WHERE id=?", (time.time(), job.id))
+        try:
+            result = profiling.profile_run(job.id, job.kind, lambda: func(job=job, **params), job.profile)
+            self._finish(job, "DONE", result=result)
+        except JobCancelled:
+            self._finish(job, "CANCELLED")
+        except Exception as e:
+            traceback.print_exc()
+            self._finish(job, "FAILED", error=str(e))
+
+    def _finish(self, job, status, result=None, error=None):
+        self._execute(
+            "UPDATE jobs SET status=?, processed=?, total=?, result=?, error=?, finished_at=? WHERE id=?",
+            (status, job.processed, job.total, json.dumps(result) if result is not None else None, error, time.time(), job.id)
+        )
+        with self.lock:
+            self.active.pop(job.id, None)
+        if job.cleanup:
+            try:
+                job.cleanup()
+            except Exception as e:
+                print(f"Cleanup of job {job.id} failed: {e}")
+        job.done.set()
+
+    def save_progress(self, job):
+        self._execute("UPDATE jobs SET processed=?, total=? WHERE id=?", (job.processed, job.total, job.id))
+
+    def cancel(self, job_id):
+        """Requests cancellation; the stage stops at its next batch boundary. Returns False for unknown/finished jobs."""
+        with self.lock:
+            job = self.active.get(job_id)
+        if job is None:
+            return False
+        job.cancel_event.set()
+        self._execute("UPDATE jobs SET cancel_requested=1 WHERE id=?", (job_id,))
+        return True
+
+    def wait(self, job_id, timeout=None):
+        """Blocks until the job finishes (or `timeout` seconds pass) and returns its state."""
+        with self.lock:
+            job = self.active.get(job_id)
+        if job is not None:
+            job.done.wait(timeout)
+        return self.get(job_id)
+
+    def get(self, job_id):
+        rows = self._query("SELECT * FROM jobs WHERE id=?", (job_id,))
+        if not rows:
+            return None
+        info = describe(rows[0])
+
+        with self.lock:
+            job = self.active.get(job_id)
+        if job is not None and info["status"] == "RUNNING":
+            # Live counters are fresher than the last flushed row
+            info.update(progress(info["started_at"], job.processed, job.total))
+        return info
+
+    def list(self, limit=20):
+        return [describe(row) for row in self._query("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))]
+
+def progress(started_at, processed, total):
+    elapsed = time.time() - started_at if started_at else 0
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    eta = (total - processed) / rate if rate > 0 and total is not None else None
+    return {
+        "processed": processed,
+        "total": total,
+        "rate_per_sec": round(rate, 2),
+        "eta_seconds": round(eta, 1) if eta is not None else None
+    }
+
+def describe(row):
+    info = {
+        "id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "params": json.loads(row["params"]) if row["params"] else {},
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"],
+        "cancel_requested": bool(row["cancel_requested"]),
+        "owner": row["owner"],
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "finished_at": row["finished_at"]
+    }
+    info.update(progress(row["started_at"], row["processed"] or 0, row["total"]))
+    if row["finished_at"] and row["started_at"]:
+        elapsed = row["finished_at"] - row["started_at"]
+        info["rate_per_sec"] = round((row["processed"] or 0) / elapsed, 2) if elapsed > 0 else 0.0
+        info["eta_seconds"] = None
+    return info
+
+manager = JobManager()
+
+ACTIVE_JOBS = metrics.Gauge("leadgen_jobs_active", "Jobs queued or running in this process", function=lambda: len(manager.active))
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Persistent, content-addressed cache of LLM completions.
+# Keys hash the model, temperature and normalized prompt, so identical prompts
+# (same role/industry/company, reruns) are answered locally without a request.
+
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "llm_cache.db")
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "on").lower() not in ("0", "off", "false", "no")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "100000"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+EVICT_EVERY = 500
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_prompt(text):
+    """Collapses whitespace, so indentation changes in prompt templates do not miss the cache"""
+    return _WHITESPACE.sub(" ", text).strip()
+
+def cache_key(model, temperature, messages, response_format=None):
+    payload = {
+        "model": model,
+        "temperature": temperature,
+        "messages": [{"role": m["role"], "content": normalize_prompt(m["content"])} for m in messages],
+        "response_format": response_format
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+class LLMCache:
+    """
+    SQLite-backed response cache with TTL expiry and LRU eviction past `max_entries`.
+    Safe to share between threads; keeps hit/miss counters for the process.
+    """
+
+    def __init__(self, path=LLM_CACHE_DB, max_entries=LLM_CACHE_MAX_ENTRIES, ttl_seconds=LLM_CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.conn = None
+        self.writes = 0
+        self.stats_counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _db(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    response TEXT,
+                    created_at REAL,
+                    last_used REAL,
+                    hits INTEGER DEFAULT 0
+                )
+            ''')
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used)")
+            self.conn.commit()
+        return self.conn
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            conn = self._db()
+            row = conn.execute("SELECT response, created_at FROM llm_cache WHERE key=?", (key,)).fetchone()
+            if row and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM llm_cache WHERE key=?", (key,))
+                conn.commit()
+                row = None
+
+            if row is None:
+                self.stats_counters["misses"] += 1
+                return None
+
+            conn.execute("UPDATE llm_cache SET last_used=?, hits=hits+1 WHERE key=?", (now, key))
+            conn.commit()
+            self.stats_counters["hits"] += 1
+            return row[0]
+
+    def put(self, key, model, response):
+        now = time.time()
+        with self.lock:
+            conn = self._db()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, created_at, last_used, hits) VALUES (?, ?, ?, ?, ?, 0)",
+                (key, model, response, now, now)
+            )
+            conn.commit()
+            self.stats_counters["stores"] += 1
+            self.writes += 1
+            if self.writes % EVICT_EVERY == 0:
+                self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        removed = 0
+        if self.ttl_seconds:
+            removed += conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        excess = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            removed += conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_used LIMIT ?)",
+                (excess,)
+            ).rowcount
+        conn.commit()
+        self.stats_counters["evictions"] += removed
+
+    def evict(self):
+        with self.lock:
+            self._evict(self._db(), time.time())
+
+    def invalidate(self, model=None):
+        """Drops every cached response, or only those for `model`. Returns the number removed."""
+        with self.lock:
+            conn = self._db()
+            if model:
+                removed = conn.execute("DELETE FROM llm_cache WHERE model=?", (model,)).rowcount
+            else:
+                removed = conn.execute("DELETE FROM llm_cache").rowcount
+            conn.commit()
+            return removed
+
+    def stats(self):
+        with self.lock:
+            entries = self._db().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            counters = dict(self.stats_counters)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "enabled": LLM_CACHE_ENABLED
+        }
+
+cache = LLMCache()
@@ -0,0 +1,388 @@
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+from dotenv import load_dotenv
+
+import llm_cache
+import metrics
+from rate_limit import backoff_delay
+
+load_dotenv()
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BUDGET = float(os.getenv("LLM_RETRY_BUDGET", "0.2"))  # retries + hedges per original request
+LLM_HEDGE = os.getenv("LLM_HEDGE", "off").lower() in ("1", "on", "true", "yes")
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "32"))
+
+try:
+    from groq import Groq
+    GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+    # Retries are handled by ResilientLLMClient, not inside the SDK
+    groq_client = Groq(api_key=GROQ_API_KEY, max_retries=0) if GROQ_API_KEY else None
+except ImportError:
+    groq_client = None
+
+class LLMUnavailable(Exception):
+    """Raised instead of calling the provider while the circuit breaker is open."""
+
+class LLMTimeout(Exception):
+    pass
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for `cooldown` seconds.
+    Then a single probe is let through: success closes the breaker, failure re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"LLM circuit breaker OPEN after {self.failures} failures; using offline/template paths for {self.cooldown:.0f}s.")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+class RetryBudget:
+    """Each request earns `ratio` of a retry token; retries and hedges spend one. Keeps retry storms off a struggling provider."""
+
+    def __init__(self, ratio=LLM_RETRY_BUDGET, cap=10.0):
+        self.ratio = ratio
+        self.cap = cap
+        self.tokens = cap
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+class LatencyTracker:
+    """Recent successful call latencies, for the hedging threshold"""
+
+    def __init__(self, size=500):
+        self.samples = collections.deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct):
+        with self.lock:
+            if len(self.samples) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+# One provider, so health and budgets are shared by every wrapped client in the process
+breaker = CircuitBreaker()
+retry_budget = RetryBudget()
+latencies = LatencyTracker()
+counters = collections.Counter()
+_counters_lock = threading.Lock()
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=LLM_MAX_INFLIGHT, thread_name_prefix="llm")
+
+def count(name, amount=1):
+    """Bumps one of the shared `counters` (called from the executor threads too)"""
+    with _counters_lock:
+        counters[name] += amount
+
+class ResilientLLMClient:
+    """
+    Wraps a Groq-shaped client with a per-call timeout (also passed to the provider call, so
+    an abandoned attempt does not keep an executor thread past the deadline), retries with backoff (limited by
+    the shared retry budget), optional hedged duplicates once a call runs past the recent
+    p95, and the shared circuit breaker. Accepts `rate_limiter=` (a TokenBucket) so only
+    real provider attempts spend rate-limit tokens.
+    """
+
+    def __init__(self, client, timeout=LLM_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES, hedge=LLM_HEDGE):
+        self.client = client
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _hedge_after(self):
+        return latencies.percentile(0.95) if self.hedge else None
+
+    def _may_hedge(self, rate_limiter):
+        if not retry_budget.withdraw():
+            return False
+        if rate_limiter and not rate_limiter.try_acquire():
+            return False
+        count("hedges")
+        return True
+
+    def _attempts(self, model):
+        """Yields attempt numbers while the breaker and the retry budget allow them"""
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                if not retry_budget.withdraw():
+                    return
+                count("retries")
+            if not breaker.allow():
+                count("shed")
+                metrics.LLM_REQUESTS.inc(model=model, outcome="shed")
+                raise LLMUnavailable("LLM circuit breaker is open")
+            if not attempt:
+                retry_budget.deposit()
+            yield attempt
+
+    def _succeeded(self, started, model, result):
+        elapsed = time.monotonic() - started
+        latencies.record(elapsed)
+        breaker.record_success()
+        metrics.LLM_REQUEST_SECONDS.observe(elapsed, model=model, outcome="ok")
+        metrics.LLM_REQUESTS.inc(model=model, outcome="ok")
+        usage = getattr(result, "usage", None)
+        for kind in ("prompt_tokens", "completion_tokens"):
+            tokens = getattr(usage, kind, None)
+            if isinstance(tokens, int):
+                metrics.LLM_TOKENS.inc(tokens, model=model, kind=kind[:-len("_tokens")])
+
+    def _failed(self, started, model, error):
+        outcome = "timeout" if isinstance(error, LLMTimeout) else "error"
+        count(outcome + "s")
+        breaker.record_failure()
+        metrics.LLM_REQUEST_SECONDS.observe(time.monotonic() - started, model=model, outcome=outcome)
+        metrics.LLM_REQUESTS.inc(model=model, outcome=outcome)
+
+    def create(self, messages, model=None, rate_limiter=None, **kwargs):
+        call = functools.partial(self.client.chat.completions.create, messages=messages, model=model, **{"timeout": self.timeout, **kwargs})
+        last_error = LLMUnavailable("LLM retry budget exhausted")
+        for attempt in self._attempts(model):
+            if attempt:
+                time.sleep(backoff_delay(attempt - 1))
+            if rate_limiter:
+                rate_limiter.acquire()
+            started = time.monotonic()
+            try:
+                with metrics.LLM_INFLIGHT.track_inprogress():
+                    result = self._race(call, rate_limiter)
+            except Exception as e:
+                self._failed(started, model, e)
+                last_error = e
+                continue
+            self._succeeded(started, model, result)
+            return result
+        raise last_error
+
+    def _race(self, call, rate_limiter):
+        deadline = time.monotonic() + self.timeout
+        original = _executor.submit(call)
+        pending = {original}
+        hedge_after = self._hedge_after()
+        error = None
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            wait_for = min(remaining, hedge_after) if hedge_after else remaining
+            done, pending = concurrent.futures.wait(pending, timeout=wait_for, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    count("hedge_wins", future is not original)
+                    return future.result()
+                error = future.exception()
+            if not done and hedge_after:
+                if self._may_hedge(rate_limiter):
+                    pending.add(_executor.submit(call))
+                hedge_after = None
+
+        if error is not None and not pending:
+            raise error
+        raise LLMTimeout(f"LLM call timed out after {self.timeout:.0f}s")
+
+class ResilientAsyncLLMClient(ResilientLLMClient):
+    """Async variant for clients shaped like `groq.AsyncGroq`."""
+
+    async def create(self, messages, model=None, rate_limiter=None, **kwargs):
+        call = functools.partial(self.client.chat.completions.create, messages=messages, model=model, **{"timeout": self.timeout, **kwargs})
+        last_error = LLMUnavailable("LLM retry budget exhausted")
+        for attempt in self._attempts(model):
+            if attempt:
+                await asyncio.sleep(backoff_delay(attempt - 1))
+            if rate_limiter:
+                await rate_limiter.acquire_async()
+            started = time.monotonic()
+            try:
+                with metrics.LLM_INFLIGHT.track_inprogress():
+                    result = await self._race(call, rate_limiter)
+            except Exception as e:
+                self._failed(started, model, e)
+                last_error = e
+                continue
+            self._succeeded(started, model, result)
+            return result
+        raise last_error
+
+    async def _race(self, call, rate_limiter):
+        deadline = time.monotonic() + self.timeout
+        original = asyncio.ensure_future(call())
+        pending = {original}
+        hedge_after = self._hedge_after()
+        error = None
+
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                wait_for = min(remaining, hedge_after) if hedge_after else remaining
+                done, pending = await asyncio.wait(pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        count("hedge_wins", task is not original)
+                        return task.result()
+                    error = task.exception()
+                if not done and hedge_after:
+                    if self._may_hedge(rate_limiter):
+                        pending.add(asyncio.ensure_future(call()))
+                    hedge_after = None
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if error is not None and not pending:
+            raise error
+        raise LLMTimeout(f"LLM call timed out after {self.timeout:.0f}s")
+
+def health():
+    p95 = latencies.percentile(0.95)
+    with _counters_lock:
+        snapshot = {name: counters[name] for name in ("retries", "hedges", "hedge_wins", "timeouts", "errors", "shed")}
+    return {
+        "breaker": breaker.state,
+        "consecutive_failures": breaker.failures,
+        "retry_budget": round(retry_budget.tokens, 2),
+        "p95_seconds": round(p95, 3) if p95 is not None else None,
+        "hedging": LLM_HEDGE,
+        "timeout_seconds": LLM_TIMEOUT_SECONDS,
+        **snapshot
+    }
+
+class CachedLLMClient:
+    """
+    Wraps a Groq-shaped client (`client.chat.completions.create`) with the response cache.
+    Extra keyword arguments (e.g. `rate_limiter`) are passed through on a miss.
+    Hits come back as completions with zero token usage. Only responses that parse
+    as JSON are stored when JSON mode is requested, so a bad answer is retried next time.
+    """
+
+    def __init__(self, client, cache=None, bypass=False):
+        self.client = client
+        self.cache = cache or llm_cache.cache
+        self.bypass = bypass or not llm_cache.LLM_CACHE_ENABLED
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _lookup(self, messages, model, kwargs):
+        if self.bypass:
+            return None, None
+        key = llm_cache.cache_key(model, kwargs.get("temperature"), messages, kwargs.get("response_format"))
+        content = self.cache.get(key)
+        metrics.LLM_CACHE_LOOKUPS.inc(result="hit" if content is not None else "miss")
+        return key, cached_completion(content) if content is not None else None
+
+    def _store(self, key, model, kwargs, completion):
+        if key is None:
+            return
+        content = completion.choices[0].message.content
+        if (kwargs.get("response_format") or {}).get("type") == "json_object":
+            try:
+                json.loads(content)
+            except (TypeError, ValueError):
+                return
+        self.cache.put(key, model, content)
+
+    def create(self, messages, model=None, **kwargs):
+        key, hit = self._lookup(messages, model, kwargs)
+        if hit:
+            return hit
+        completion = self.client.chat.completions.create(messages=messages, model=model, **kwargs)
+        self._store(key, model, kwargs, completion)
+        return completion
+
+class CachedAsyncLLMClient(CachedLLMClient):
+    """Async variant for clients shaped like `groq.AsyncGroq`."""
+
+    async def create(self, messages, model=None, **kwargs):
+        key, hit = self._lookup(messages, model, kwargs)
+        if hit:
+            return hit
+        completion = await self.client.chat.completions.create(messages=messages, model=model, **kwargs)
+        self._store(key, model, kwargs, completion)
+        return completion
+
+def cached_completion(content):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(prompt_tokens=0, completion_tokens=0, total_tokens=0),
+        cached=True
+    )
+
+def wrap(llm, use_cache=None):
+    """
+    Puts `llm` behind the resilience layer and the response cache (None stays None).
+    `use_cache=False` skips cache lookups and stores. Already wrapped clients are
+    returned unchanged unless `use_cache` is given (new wrappers cache by default).
+    """
+    if llm is None:
+        return None
+    bypass = use_cache is False or not llm_cache.LLM_CACHE_ENABLED
+    if isinstance(llm, CachedLLMClient):
+        if use_cache is None or llm.bypass == bypass:
+            return llm
+        llm = llm.client
+    if not isinstance(llm, ResilientLLMClient):
+        if asyncio.iscoroutinefunction(llm.chat.completions.create):
+            llm = ResilientAsyncLLMClient(llm)
+        else:
+            llm = ResilientLLMClient(llm)
+    if isinstance(llm, ResilientAsyncLLMClient):
+        return CachedAsyncLLMClient(llm, bypass=bypass)
+    return CachedLLMClient(llm, bypass=bypass)
+
+client = wrap(groq_client)
@@ -0,0 +1,198 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+import profiling
+
+# In-process metrics rendered in the Prometheus text format (GET /metrics).
+# Deliberately tiny and dependency-free: counters, gauges and histograms with labels.
+# Stages run inside the API process as jobs, so its /metrics covers every stage;
+# CLI runs keep their own (unexported) registry.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_text(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_label_text(self.labelnames, key)} {_number(value)}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def render(self):
+        if self.function is not None:
+            # Callback gauge: sampled at scrape time
+            try:
+                self.set(self.function())
+            except Exception:
+                pass
+        return super().render()
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self, key, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, ('le', _number(float(bound))))} {cumulative}")
+        labels = _label_text(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_number(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+def render():
+    """Every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# Database
+DB_BATCH_SECONDS = Histogram("leadgen_db_batch_seconds", "Time per batched database write or claim", ["op"])
+DB_ROWS = Counter("leadgen_db_rows_total", "Rows written or claimed by batched database operations", ["op"])
+
+def db_batch(op, count_rows, phase="db_write"):
+    """
+    Decorator timing a batched database write or claim; count_rows(args, result) gives its row count.
+    The call also counts towards `phase` of a profiled run.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            with profiling.span(phase):
+                result = func(*args, **kwargs)
+            DB_BATCH_SECONDS.observe(time.perf_counter() - started, op=op)
+            DB_ROWS.inc(count_rows(args, result), op=op)
+            return result
+        return wrapper
+    return decorate
+
+def cursor_rows(args, result):
+    """Row count of a helper called as func(cursor, rows, ...)"""
+    return max(args[0].rowcount, 0)
+
+def returned_rows(args, result):
+    return len(result)
+
+# LLM
+LLM_REQUEST_SECONDS = Histogram("leadgen_llm_request_seconds", "LLM request latency per attempt", ["model", "outcome"])
+LLM_REQUESTS = Counter("leadgen_llm_requests_total", "LLM request attempts by outcome (ok, error, timeout, shed)", ["model", "outcome"])
+LLM_TOKENS = Counter("leadgen_llm_tokens_total", "LLM token usage", ["model", "kind"])
+LLM_CACHE_LOOKUPS = Counter("leadgen_llm_cache_lookups_total", "LLM response cache lookups", ["result"])
+LLM_INFLIGHT = Gauge("leadgen_llm_inflight", "LLM requests currently in flight")
+
+# Templates
+TEMPLATE_RENDER_SECONDS = Histogram("leadgen_template_render_seconds", "Time per template render batch")
+TEMPLATE_RENDERS = Counter("leadgen_template_renders_total", "Messages rendered from templates")
+
+# SMTP / LinkedIn
+SMTP_SEND_SECONDS = Histogram("leadgen_smtp_send_seconds", "Email send latency including retries", ["outcome"])
+SMTP_SENDS = Counter("leadgen_smtp_sends_total", "Emails by final outcome", ["outcome"])
+SMTP_ATTEMPTS = Counter("leadgen_smtp_attempts_total", "SMTP delivery attempts (first tries plus retries)")
+SMTP_INFLIGHT = Gauge("leadgen_smtp_inflight", "Emails currently being sent")
+LINKEDIN_SENDS = Counter("leadgen_linkedin_sends_total", "LinkedIn DMs by outcome", ["outcome"])
+
+# Streaming pipeline
+PIPELINE_STAGE_SECONDS = Histogram("leadgen_pipeline_stage_batch_seconds", "Time a pipeline stage spends on one batch", ["stage"])
+PIPELINE_IDLE_SECONDS = Counter("leadgen_pipeline_stage_idle_seconds_total", "Time a pipeline stage waited for input", ["stage"])
+PIPELINE_QUEUE_DEPTH = Gauge("leadgen_pipeline_queue_depth", "Batches waiting in front of a pipeline stage", ["stage"])
@@ -2,7 +2,15 @@ import asyncio
 from aiosmtpd.controller import Controller
 
 class CustomHandler:
+    def __init__(self, verbose=True):
+        self.verbose = verbose
+        self.received = 0
+
     async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        if not self.verbose:
+            return '250 Message accepted for delivery'
+
         print("\n" + "="*40)
         print(f"NEW EMAIL RECEIVED")
         print("="*40)
@@ -0,0 +1,177 @@
+import logging
+import os
+import re
+from logging.handlers import RotatingFileHandler
+
+# Outreach log: size-rotated file plus readers that never load the whole file.
+# tail() seeks backwards from EOF block by block; follow() returns only the bytes
+# written after a cursor, so the dashboard's cost does not grow with the log.
+
+LOG_FILE = os.getenv("OUTREACH_LOG", "outreach.log")
+LOG_MAX_BYTES = int(os.getenv("OUTREACH_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("OUTREACH_LOG_BACKUPS", "5"))
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+TAIL_BLOCK_SIZE = 64 * 1024
+MAX_TAIL_LINES = 5000
+MAX_SCAN_BYTES = int(os.getenv("OUTREACH_LOG_MAX_SCAN_BYTES", str(8 * 1024 * 1024)))
+MAX_FOLLOW_BYTES = 1024 * 1024
+
+LEVEL_RE = re.compile(r" - (DEBUG|INFO|WARNING|ERROR|CRITICAL) - ")
+
+_handler = None
+
+def get_handler(path=LOG_FILE):
+    """The process-wide rotating handler for the outreach log (opened on first write)"""
+    global _handler
+    if _handler is None:
+        _handler = RotatingFileHandler(
+            path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8", delay=True
+        )
+        _handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return _handler
+
+def get_logger():
+    """The "outreach" logger: writes only to the outreach log, not through the root logger"""
+    logger = logging.getLogger("outreach")
+    if not logger.handlers:
+        logger.addHandler(get_handler())
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+def rotate():
+    """Starts a fresh log file, keeping the old one as the first backup"""
+    handler = get_handler()
+    handler.acquire()
+    try:
+        if os.path.exists(handler.baseFilename):
+            handler.doRollover()
+    finally:
+        handler.release()
+
+def _matches(line, level, lead):
+    if level:
+        found = LEVEL_RE.search(line)
+        if not found or found.group(1) != level:
+            return False
+    return not lead or lead in line
+
+def _cursor(inode, offset):
+    """Position in one specific file: the inode tells a rotated file from its successor"""
+    return f"{inode}:{offset}"
+
+def _parse_cursor(cursor):
+    try:
+        inode, offset = cursor.split(":")
+        return int(inode), int(offset)
+    except ValueError:
+        raise ValueError("Invalid log cursor")
+
+def tail(lines=200, level=None, lead=None, path=LOG_FILE):
+    """
+    Last `lines` matching lines, oldest first, read backwards from EOF in blocks.
+    With filters at most MAX_SCAN_BYTES are scanned, so a rare match costs bounded time.
+    Returns {"lines", "cursor"}; pass the cursor to follow() for what gets written next.
+    """
+    lines = max(1, min(int(lines), MAX_TAIL_LINES))
+    level = level.upper() if level else None
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return {"lines": [], "cursor": None}
+
+    found = []
+    with f:
+        stat = os.fstat(f.fileno())
+        position = stat.st_size
+        cursor = None
+        carry = b""
+        while position > 0 and len(found) < lines and stat.st_size - position < MAX_SCAN_BYTES:
+            start = max(0, position - TAIL_BLOCK_SIZE)
+            f.seek(start)
+            parts = (f.read(position - start) + carry).split(b"\n")
+            position = start
+            if cursor is None:
+                # A line still being written is left for follow() to pick up
+                cursor = _cursor(stat.st_ino, stat.st_size - len(parts.pop()))
+            # The first part may continue in the previous block
+            carry = parts.pop(0) if position > 0 else b""
+            for raw in reversed(parts):
+                line = raw.rstrip(b"\r").decode("utf-8", "replace")
+                if line and _matches(line, level, lead):
+                    found.append(line)
+                    if len(found) >= lines:
+                        break
+
+    found.reverse()
+    return {"lines": found, "cursor": cursor or _cursor(stat.st_ino, 0)}
+
+def _read_lines(path, inode, offset, limit):
+    """
+    Complete lines written after `offset` to `path` if it is still the file `inode`.
+    Returns (data, new offset, bytes left unread) or None when the file is gone or was replaced.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        stat = os.fstat(f.fileno())
+        if stat.st_ino != inode:
+            return None
+        size = stat.st_size
+        if offset > size:
+            # Truncated in place: start over
+            offset = 0
+        f.seek(offset)
+        data = f.read(limit)
+    data = data[:data.rfind(b"\n") + 1]
+    offset += len(data)
+    return data, offset, size - offset
+
+def _chain(path):
+    """(name, inode) of the backups, oldest first, followed by the live file"""
+    chain = []
+    for name in [f"{path}.{i}" for i in range(LOG_BACKUP_COUNT, 0, -1)] + [path]:
+        try:
+            chain.append((name, os.stat(name).st_ino))
+        except FileNotFoundError:
+            pass
+    return chain
+
+def follow(cursor, level=None, lead=None, path=LOG_FILE):
+    """
+    Lines written since `cursor` (from tail() or a previous follow()), at most MAX_FOLLOW_BYTES.
+    If the log rotated in between, the rest of the cursor's file is read from its backup
+    and then the newer files in order. Returns {"lines", "cursor", "more"}; with `more` call again.
+    """
+    inode, offset = _parse_cursor(cursor)
+    level = level.upper() if level else None
+    chain = _chain(path)
+    if not chain:
+        return {"lines": [], "cursor": cursor, "more": False}
+
+    position = next((i for i, (_, ino) in enumerate(chain) if ino == inode), None)
+    if position is None:
+        # The cursor's file is gone (rotated out of the backups or deleted)
+        position, offset = len(chain) - 1, 0
+
+    data = b""
+    while True:
+        name, inode = chain[position]
+        result = _read_lines(name, inode, offset, MAX_FOLLOW_BYTES - len(data))
+        if result is None:
+            # Rotated while reading: the next call picks it up from the backup
+            return _result(data, _cursor(inode, offset), level, lead, True)
+        chunk, offset, left = result
+        data += chunk
+        if left > 0 or position == len(chain) - 1:
+            return _result(data, _cursor(inode, offset), level, lead, left > 0)
+        position, offset = position + 1, 0
+
+def _result(data, cursor, level, lead, more):
+    # rstrip: the log may have been written with CRLF endings (e.g. on Windows)
+    lines = [line.rstrip("\r") for line in data.decode("utf-8", "replace").split("\n")]
+    lines = [line for line in lines if line and _matches(line, level, lead)]
+    return {"lines": lines, "cursor": cursor, "more": more}
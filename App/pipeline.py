@@ -0,0 +1,255 @@
+import asyncio
+import json
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import events
+import jobs
+import metrics
+import profiling
+import generate_leads
+import enrich_leads
+import generate_messages
+import send_messages
+from rate_limit import TokenBucket
+from llm_client import wrap
+
+# Streaming mode: the four stages run at once, connected by bounded queues of lead IDs.
+# A lead is enriched, messaged and sent as soon as the previous stage commits it,
+# and a full queue blocks the stage feeding it, so memory stays bounded.
+
+PIPELINE_BATCH_SIZE = int(os.getenv("PIPELINE_BATCH_SIZE", "50"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+
+_DONE = object()
+
+class PipelineStopped(Exception):
+    pass
+
+def _put(q, item, stop):
+    while True:
+        if stop.is_set():
+            raise PipelineStopped()
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+def _get(q, stop):
+    while True:
+        if stop.is_set():
+            raise PipelineStopped()
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+
+class StreamingPipeline:
+    """
+    Runs generate -> enrich -> messages -> send as concurrent threads.
+    Each stage leases the IDs it receives (database.claim_lead_ids), writes its
+    results with the usual update helpers, commits, and passes the IDs on.
+    """
+
+    def __init__(self, num_leads, seed=None, enrich_mode="offline", message_mode="auto", send_mode="dry_run",
+                 batch_size=None, queue_size=None, llm_client=None, job=None):
+        self.num_leads = num_leads
+        self.seed = random.randrange(2**32) if seed is None else seed
+        self.enrich_mode = enrich_mode
+        self.message_mode = message_mode
+        self.send_mode = send_mode
+        self.batch_size = batch_size or PIPELINE_BATCH_SIZE
+        self.llm = wrap(llm_client)
+        self.job = job
+
+        queue_size = queue_size or PIPELINE_QUEUE_SIZE
+        self.to_enrich = queue.Queue(maxsize=queue_size)
+        self.to_message = queue.Queue(maxsize=queue_size)
+        self.to_send = queue.Queue(maxsize=queue_size)
+
+        self.stop = threading.Event()
+        self.errors = []
+        self.counts = {"generated": 0, "enriched": 0, "messaged": 0, "sent": 0}
+        self.worker_ids = {stage: database.new_worker_id(f"pipeline-{stage}") for stage in ("enrich", "messages", "send")}
+        self.started = None
+        self.first_send = None
+        self.llm_bucket = TokenBucket.per_minute(enrich_leads.AI_REQUESTS_PER_MINUTE)
+        self.sender = None
+
+    def run(self):
+        print(f"Starting Streaming Pipeline: {self.num_leads} leads (enrich={self.enrich_mode}, messages={self.message_mode}, send={self.send_mode})...")
+        database.init_db()
+        if self.job:
+            self.job.set_total(self.num_leads)
+
+        self.started = time.time()
+        threads = [
+            threading.Thread(target=profiling.propagate(self._stage), args=("generate", self._generate, None, self.to_enrich), name="pipeline-generate"),
+            threading.Thread(target=profiling.propagate(self._stage), args=("enrich", self._enrich, self.to_enrich, self.to_message), name="pipeline-enrich"),
+            threading.Thread(target=profiling.propagate(self._stage), args=("messages", self._message, self.to_message, self.to_send), name="pipeline-messages"),
+            threading.Thread(target=profiling.propagate(self._stage), args=("send", self._send, self.to_send, None), name="pipeline-send"),
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            if self.sender:
+                self.sender.shutdown()
+                self.pool.close()
+            events.flush()
+
+        if self.errors:
+            conn = database.get_db_connection()
+            for worker_id in self.worker_ids.values():
+                database.release_leads(worker_id, conn=conn)
+            conn.close()
+            raise self.errors[0]
+
+        elapsed = time.time() - self.started
+        print(f"Pipeline Complete: {self.counts['sent']} leads sent in {elapsed:.1f}s.")
+        return {
+            **self.counts,
+            "seed": self.seed,
+            "elapsed_seconds": round(elapsed, 2),
+            "first_send_seconds": round(self.first_send - self.started, 2) if self.first_send else None
+        }
+
+    def _stage(self, name, process, inbox, outbox):
+        conn = database.get_db_connection()
+        try:
+            if inbox is None:
+                for lead_ids in process(conn):
+                    _put(outbox, lead_ids, self.stop)
+            else:
+                while True:
+                    waited = time.perf_counter()
+                    lead_ids = _get(inbox, self.stop)
+                    metrics.PIPELINE_IDLE_SECONDS.inc(time.perf_counter() - waited, stage=name)
+                    metrics.PIPELINE_QUEUE_DEPTH.set(inbox.qsize(), stage=name)
+                    if lead_ids is _DONE:
+                        break
+                    with metrics.PIPELINE_STAGE_SECONDS.time(stage=name):
+                        done_ids = process(conn, lead_ids)
+                    if outbox is not None and done_ids:
+                        _put(outbox, done_ids, self.stop)
+            if outbox is not None:
+                _put(outbox, _DONE, self.stop)
+        except PipelineStopped:
+            pass
+        except BaseException as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if not isinstance(e, jobs.JobCancelled):
+                print(f"Pipeline stage '{name}' failed: {e}")
+            self.errors.append(e)
+            self.stop.set()
+        finally:
+            conn.close()
+
+    def _generate(self, conn):
+        shards = generate_leads.iter_shards(self.num_leads, self.seed, shard_size=self.batch_size)
+        try:
+            for rows in shards:
+                lead_ids = generate_leads.insert_new_leads(conn, rows)
+                self.counts["generated"] += len(lead_ids)
+                if self.job and len(lead_ids) < len(rows):
+                    # Skipped duplicates never reach the send stage, which is what advances the job
+                    self.job.set_total(self.job.total - (len(rows) - len(lead_ids)))
+                if lead_ids:
+                    yield lead_ids
+        finally:
+            shards.close()
+
+    def _enrich(self, conn, lead_ids):
+        worker_id = self.worker_ids["enrich"]
+        leads = database.claim_lead_ids(lead_ids, "NEW", worker_id, enrich_leads.ENRICH_COLUMNS, conn=conn)
+        if not leads:
+            return []
+
+        if self.enrich_mode == "ai" and (self.llm or enrich_leads.client):
+            asyncio.run(enrich_leads.enrich_data_async(
+                leads, self.llm or enrich_leads.client, conn, worker_id=worker_id, bucket=self.llm_bucket
+            ))
+        else:
+            database.update_enrichment(conn.cursor(), enrich_leads.enrich_batch(leads), worker_id)
+            conn.commit()
+
+        self.counts["enriched"] += len(leads)
+        return [lead['id'] for lead in leads]
+
+    def _message(self, conn, lead_ids):
+        worker_id = self.worker_ids["messages"]
+        leads = database.claim_lead_ids(lead_ids, "ENRICHED", worker_id, generate_messages.MESSAGE_COLUMNS, conn=conn)
+        if not leads:
+            return []
+
+        if self.message_mode == "batch":
+            rows = generate_messages.render_templates_batch(leads)
+        else:
+            llm = self.llm or generate_messages.client
+            rows = []
+            for lead in leads:
+                generated_msg, source = generate_messages.generate_lead_message(lead, llm)
+                rows.append((json.dumps(generated_msg), source, lead['id']))
+        database.update_messages(conn.cursor(), rows, worker_id)
+        conn.commit()
+
+        self.counts["messaged"] += len(leads)
+        return [lead['id'] for lead in leads]
+
+    def _send(self, conn, lead_ids):
+        worker_id = self.worker_ids["send"]
+        leads = database.claim_lead_ids(lead_ids, "MESSAGED", worker_id, send_messages.SEND_COLUMNS, conn=conn)
+        if not leads:
+            return []
+
+        if self.first_send is None:
+            self.first_send = time.time()
+
+        positions = range(self.counts["sent"] + 1, self.counts["sent"] + len(leads) + 1)
+        if self.send_mode == "live":
+            sender, pool, email_bucket, linkedin_bucket = self._live_sender()
+            with profiling.span("smtp"):
+                statuses = list(sender.map(
+                    lambda lead, position: send_messages.send_lead(lead, "live", position, self.num_leads, pool, email_bucket, linkedin_bucket),
+                    leads, positions
+                ))
+        else:
+            statuses = [send_messages.send_lead(lead, self.send_mode, position, self.num_leads) for lead, position in zip(leads, positions)]
+
+        database.update_status(conn.cursor(), [(status, lead['id']) for status, lead in zip(statuses, leads)], worker_id)
+        conn.commit()
+
+        self.counts["sent"] += len(leads)
+        if self.job:
+            self.job.advance(len(leads))
+            self.job.check_cancelled()
+        return [lead['id'] for lead in leads]
+
+    def _live_sender(self):
+        # Live sends reuse the threaded SMTP pool; created on first use and kept for the whole run
+        if self.sender is None:
+            self.pool = send_messages.SMTPConnectionPool(send_messages.SMTP_POOL_SIZE)
+            self.sender = ThreadPoolExecutor(max_workers=self.pool.size)
+            self.email_bucket = TokenBucket.per_minute(send_messages.MESSAGES_PER_MINUTE, capacity=1)
+            self.linkedin_bucket = TokenBucket.per_minute(send_messages.LINKEDIN_PER_MINUTE, capacity=1)
+        return self.sender, self.pool, self.email_bucket, self.linkedin_bucket
+
+def run_pipeline(num_leads, seed=None, enrich_mode="offline", message_mode="auto", send_mode="dry_run",
+                 batch_size=None, queue_size=None, llm_client=None, job=None):
+    pipeline = StreamingPipeline(
+        num_leads, seed=seed, enrich_mode=enrich_mode, message_mode=message_mode, send_mode=send_mode,
+        batch_size=batch_size, queue_size=queue_size, llm_client=llm_client, job=job
+    )
+    return pipeline.run()
+
+if __name__ == "__main__":
+    profiling.profile_run(None, "pipeline", lambda: run_pipeline(10))
@@ -0,0 +1,297 @@
+import collections
+import contextvars
+import cProfile
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Opt-in profiling of stage runs. A profiled run (per API request with `profile`, or every
+# job with PROFILE_MODE) gets a cProfile or stack-sampling profile plus per-phase wall/CPU
+# spans, saved under PROFILE_DIR by job or run ID and served by GET /profiles/{run_id}.
+# Without an active run span() does nothing, so the hooks stay in the code permanently.
+# Spans add up every call, so phases running concurrently (async LLM calls) can exceed
+# the run's wall time, and their CPU is the thread's, including other tasks on the loop.
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MODE = os.getenv("PROFILE_MODE", "off").lower()  # off | cprofile | sample
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_TOP = 40
+
+MODES = ("cprofile", "sample")
+PHASES = ("db_read", "classify", "llm", "render", "db_write", "smtp")
+ARTIFACT_EXTENSIONS = {"cprofile": ".prof", "sample": ".collapsed"}
+RUN_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Before 3.12 cProfile only sees the thread that enabled it; from 3.12 it covers every thread
+PER_THREAD_CPROFILE = sys.version_info < (3, 12)
+
+_session = contextvars.ContextVar("profile_session", default=None)
+_phase = contextvars.ContextVar("profile_phase", default=None)
+
+def resolve_mode(mode=None):
+    """The profiler for a run: `mode` if given, else PROFILE_MODE; None when profiling is off"""
+    mode = (mode if mode is not None else PROFILE_MODE).lower()
+    if mode in ("", "off", "none", "0", "false"):
+        return None
+    if mode not in MODES:
+        raise ValueError(f"Unknown profile mode {mode!r}; use cprofile, sample or off")
+    return mode
+
+class StackSampler:
+    """
+    Wall-clock sampler: every `interval` seconds records the stack of each thread started
+    after it (plus the run's own thread) as a collapsed "thread;file:func;..." line.
+    """
+
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.ignore = {t.ident for t in threading.enumerate()} - {threading.get_ident()}
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or ident in self.ignore:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def top_functions(self):
+        own, inclusive = collections.Counter(), collections.Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if frames:
+                own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+        total = sum(self.stacks.values()) or 1
+        return [
+            {"function": name, "self_share": round(count / total, 4), "inclusive_share": round(inclusive[name] / total, 4)}
+            for name, count in own.most_common(PROFILE_TOP)
+        ]
+
+class ProfileSession:
+    def __init__(self, run_id, kind, mode):
+        self.run_id = run_id
+        self.kind = kind
+        self.mode = mode
+        self.spans = {}
+        self.thread_profiles = []
+        self.lock = threading.Lock()
+
+    def record(self, phase, wall, cpu):
+        with self.lock:
+            span = self.spans.get(phase)
+            if span is None:
+                span = self.spans[phase] = {"count": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "max_wall_seconds": 0.0}
+            span["count"] += 1
+            span["wall_seconds"] += wall
+            span["cpu_seconds"] += cpu
+            span["max_wall_seconds"] = max(span["max_wall_seconds"], wall)
+
+    def run_thread(self, func, *args, **kwargs):
+        """Runs `func` on a thread started by the stage, with its own cProfile where needed"""
+        if self.mode != "cprofile" or not PER_THREAD_CPROFILE:
+            return func(*args, **kwargs)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            with self.lock:
+                self.thread_profiles.append(profiler)
+
+    def span_summary(self):
+        order = {phase: i for i, phase in enumerate(PHASES)}
+        with self.lock:
+            items = sorted(self.spans.items(), key=lambda item: (order.get(item[0], len(order)), item[0]))
+        return {
+            phase: {
+                "count": span["count"],
+                "wall_seconds": round(span["wall_seconds"], 4),
+                "cpu_seconds": round(span["cpu_seconds"], 4),
+                "max_wall_seconds": round(span["max_wall_seconds"], 4)
+            }
+            for phase, span in items
+        }
+
+@contextmanager
+def span(phase):
+    """Adds the block's wall and thread-CPU time to `phase` of the active profiled run (no-op otherwise)"""
+    session = _session.get()
+    if session is None or _phase.get() == phase:
+        # Not profiling, or already inside this phase (counted once by the outer span)
+        yield
+        return
+    token = _phase.set(phase)
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        session.record(phase, time.perf_counter() - wall, time.thread_time() - cpu)
+        _phase.reset(token)
+
+def propagate(func):
+    """
+    Wraps `func`, the target of a thread a stage starts, so its spans (and on Python < 3.12
+    its cProfile) reach the active run. Create one wrapper per thread.
+    """
+    session = _session.get()
+    if session is None:
+        return func
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(session.run_thread, func, *args, **kwargs)
+
+def profile_run(run_id, kind, func, mode=None):
+    """
+    Calls func() and returns its result. When `mode` (or PROFILE_MODE) asks for it,
+    the call is profiled and the artifacts are saved as PROFILE_DIR/<run_id>.*
+    """
+    mode = resolve_mode(mode)
+    if mode is None:
+        return func()
+
+    session = ProfileSession(run_id or uuid.uuid4().hex, kind, mode)
+    token = _session.set(session)
+    profiler = sampler = None
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Python 3.12+: only one cProfile at a time per process
+            print(f"Profiler unavailable for {session.run_id} ({e}); recording spans only.")
+            profiler = None
+    else:
+        sampler = StackSampler()
+        sampler.start()
+
+    started_at = time.time()
+    wall, cpu = time.perf_counter(), time.process_time()
+    status, error = "DONE", None
+    try:
+        return func()
+    except BaseException as e:
+        status, error = "FAILED", f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+        if sampler:
+            sampler.stop()
+        _session.reset(token)
+        timing = {
+            "error": error,
+            "started_at": started_at,
+            "wall_seconds": round(time.perf_counter() - wall, 4),
+            "process_cpu_seconds": round(time.process_time() - cpu, 4)
+        }
+        try:
+            save(session, status, timing, profiler, sampler)
+        except OSError as e:
+            print(f"Could not save profile {session.run_id}: {e}")
+
+def _path(run_id, ext):
+    if not RUN_ID_RE.match(run_id or ""):
+        raise ValueError("Invalid run ID")
+    return os.path.join(PROFILE_DIR, run_id + ext)
+
+def save(session, status, timing, profiler=None, sampler=None):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    summary = {"run_id": session.run_id, "kind": session.kind, "mode": session.mode, "status": status, **timing,
+               "spans": session.span_summary(), "artifact": None, "top_functions": []}
+
+    if profiler:
+        stats = pstats.Stats(profiler)
+        for thread_profile in session.thread_profiles:
+            stats.add(thread_profile)
+        path = _path(session.run_id, ARTIFACT_EXTENSIONS["cprofile"])
+        stats.dump_stats(path)
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP]
+        summary["top_functions"] = [
+            {"function": pstats.func_std_string(func), "calls": calls, "self_seconds": round(own, 4), "cumulative_seconds": round(cumulative, 4)}
+            for func, (_, calls, own, cumulative, _) in rows
+        ]
+        summary["artifact"] = os.path.basename(path)
+    elif sampler:
+        path = _path(session.run_id, ARTIFACT_EXTENSIONS["sample"])
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        summary["samples"] = sampler.samples
+        summary["sample_interval_seconds"] = sampler.interval
+        summary["top_functions"] = sampler.top_functions()
+        summary["artifact"] = os.path.basename(path)
+
+    with open(_path(session.run_id, ".json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Profile saved: {os.path.join(PROFILE_DIR, session.run_id)}.json")
+    prune()
+
+def _summaries():
+    """Summary files, newest first"""
+    try:
+        names = [name for name in os.listdir(PROFILE_DIR) if name.endswith(".json")]
+    except FileNotFoundError:
+        return []
+    paths = [os.path.join(PROFILE_DIR, name) for name in names]
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+def prune(keep=PROFILE_KEEP):
+    """Deletes all but the newest `keep` profiles"""
+    for path in _summaries()[keep:]:
+        run_id = os.path.basename(path)[:-len(".json")]
+        for ext in (".json", *ARTIFACT_EXTENSIONS.values()):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, run_id + ext))
+            except FileNotFoundError:
+                pass
+
+def load(run_id):
+    """Summary of a saved profile, or None"""
+    try:
+        with open(_path(run_id, ".json"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def artifact_path(run_id):
+    """Path of the .prof/.collapsed file of a saved profile, or None"""
+    summary = load(run_id)
+    if not summary or not summary.get("artifact"):
+        return None
+    path = os.path.join(PROFILE_DIR, summary["artifact"])
+    return path if os.path.exists(path) else None
+
+def list_profiles(limit=20):
+    profiles = []
+    for path in _summaries()[:limit]:
+        with open(path, encoding="utf-8") as f:
+            summary = json.load(f)
+        profiles.append({key: summary.get(key) for key in ("run_id", "kind", "mode", "status", "started_at", "wall_seconds")})
+    return profiles
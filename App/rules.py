@@ -0,0 +1,50 @@
+import functools
+import json
+import os
+import re
+
+# Keyword rule tables (persona by role, template category by industry) compiled into
+# one regex each. Rules are checked in priority order: the first rule with any keyword
+# contained in the lowercased text wins, exactly like a chain of any(...) checks.
+
+RULES_PATH = os.getenv("RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json"))
+RULE_CACHE_SIZE = int(os.getenv("RULE_CACHE_SIZE", "65536"))
+
+class RuleSet:
+    """
+    Ordered (label, keywords) rules compiled into a single anchored alternation of lookaheads:
+    ^(?:(?=.*(?:kw1|kw2))(?P<r0>)|(?=.*(?:kw3))(?P<r1>)|...)
+    The regex engine tries the branches in order, so the match reports the highest-priority
+    rule even when a later rule's keyword appears earlier in the text ("director" contains "cto").
+    Results are memoized per distinct input string.
+    """
+
+    def __init__(self, rules, default):
+        self.rules = [(label, [kw.lower() for kw in keywords]) for label, keywords in rules if keywords]
+        self.default = default
+        self.labels = [label for label, _ in self.rules]
+
+        branches = [
+            f"(?=.*(?:{'|'.join(re.escape(kw) for kw in keywords)}))(?P<r{i}>)"
+            for i, (_, keywords) in enumerate(self.rules)
+        ]
+        self.regex = re.compile(f"^(?:{'|'.join(branches)})", re.DOTALL) if branches else None
+        self.classify = functools.lru_cache(maxsize=RULE_CACHE_SIZE)(self._classify)
+
+    def _classify(self, text):
+        if not text or self.regex is None:
+            return self.default
+        match = self.regex.match(text.lower())
+        if match is None:
+            return self.default
+        return self.labels[int(match.lastgroup[1:])]
+
+    @classmethod
+    def from_config(cls, config):
+        """config: {"default": label, "rules": [{"label": ..., "keywords": [...]}, ...]}"""
+        return cls([(rule["label"], rule["keywords"]) for rule in config["rules"]], config["default"])
+
+def load_rules(name, path=RULES_PATH):
+    """Loads the rule table `name` from the rules file"""
+    with open(path, encoding="utf-8") as f:
+        return RuleSet.from_config(json.load(f)[name])
@@ -1,119 +1,392 @@
+import asyncio
 import smtplib
 import json
+import os
+import queue
 import time
-import logging
 import sys
 import database  
+import events
+import metrics
+import profiling
+import outreach_log
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from rate_limit import TokenBucket, backoff_delay
+from smtp_dispatcher import AsyncDispatcher
+from validation import EMAIL_RE
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
 SMTP_SERVER = "localhost"
 SMTP_PORT = 1025 
 MAX_RETRIES = 2
-MESSAGES_PER_MINUTE = 60 
-DELAY_BETWEEN_MSGS = 60 / MESSAGES_PER_MINUTE 
-
-logging.basicConfig(
-    filename='outreach.log', 
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    force=True
-)
+MESSAGES_PER_MINUTE = int(os.getenv("SEND_MESSAGES_PER_MINUTE", "60"))
+LINKEDIN_PER_MINUTE = int(os.getenv("LINKEDIN_PER_MINUTE", "120"))
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+SMTP_MAX_SESSIONS = int(os.getenv("SMTP_MAX_SESSIONS", "16"))
+SMTP_PER_DOMAIN = int(os.getenv("SMTP_PER_DOMAIN", "4"))
+SENDER_ADDRESS = "me@agentic-ai.com"
 
 try:
     sys.stdout.reconfigure(encoding='utf-8')
 except AttributeError:
     pass
 
-def send_email_with_retry(to_email, subject, body, retries=MAX_RETRIES):
+class SMTPSession:
+    """One persistent SMTP connection, opened lazily and reused for many messages."""
+
+    def __init__(self, host=None, port=None):
+        self.host = host or SMTP_SERVER
+        self.port = port or SMTP_PORT
+        self.server = None
+
+    def send(self, msg):
+        if self.server is None:
+            self.server = smtplib.SMTP(self.host, self.port)
+        try:
+            self.server.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # Connection is gone: drop it and reconnect on the next send
+            self.close()
+            raise
+        except smtplib.SMTPException:
+            # Server rejected this message: reset the transaction, keep the connection
+            try:
+                self.server.rset()
+            except (smtplib.SMTPException, OSError):
+                self.close()
+            raise
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                self.server.close()
+            self.server = None
+
+class SMTPConnectionPool:
+    """Bounded pool of SMTPSessions shared by the sending threads."""
+
+    def __init__(self, size=SMTP_POOL_SIZE, host=None, port=None):
+        self.size = size
+        self.sessions = queue.LifoQueue()
+        for _ in range(size):
+            self.sessions.put(SMTPSession(host or SMTP_SERVER, port or SMTP_PORT))
+
+    @contextmanager
+    def session(self):
+        session = self.sessions.get()
+        try:
+            yield session
+        finally:
+            self.sessions.put(session)
+
+    def close(self):
+        for _ in range(self.size):
+            self.sessions.get().close()
+
+def build_email(to_email, subject, body):
+    msg = MIMEMultipart()
+    msg['From'] = SENDER_ADDRESS
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+def send_email_attempts(to_email, subject, body, retries=MAX_RETRIES, pool=None):
     """
     Sends email via Local Mock SMTP Server.
     Includes Retry Logic (Assignment Condition).
+    Reuses a pooled connection when `pool` is given, otherwise opens one for this email.
+    Returns (success, attempts, last_error) like AsyncDispatcher.send.
     """
+    msg = build_email(to_email, subject, body)
     attempt = 0
+    last_error = None
     while attempt <= retries:
         try:
-            msg = MIMEMultipart()
-            msg['From'] = "me@agentic-ai.com"
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            msg.attach(MIMEText(body, 'plain'))
-
-            with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-                server.send_message(msg)
-            return True 
+            if pool:
+                with pool.session() as session:
+                    session.send(msg)
+            else:
+                with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+                    server.send_message(msg)
+            return True, attempt + 1, None
         except Exception as e:
+            last_error = e
             print(f"SMTP Error: {e}. Retrying ({attempt+1}/{retries})...")
+            if attempt < retries:
+                time.sleep(backoff_delay(attempt))
             attempt += 1
-            time.sleep(1) 
-    return False 
+    return False, attempt, last_error
+
+def send_email_with_retry(to_email, subject, body, retries=MAX_RETRIES, pool=None):
+    return send_email_attempts(to_email, subject, body, retries, pool)[0]
+
+SEND_COLUMNS = ["id", "full_name", "company_name", "email", "generated_messages"]
+
+def parse_lead_messages(lead):
+    try:
+        msgs = json.loads(lead['generated_messages'])
+    except:
+        msgs = {}
+
+    email_data = msgs.get("email_variant_1", {})
+    linkedin_msg = msgs.get("linkedin_variant_1", "Hi, let's connect.")
+    return email_data, linkedin_msg
+
+def email_error(lead):
+    """Why the lead cannot be emailed (LinkedIn-only imports have no address), or None"""
+    if not lead['email']:
+        return "no email address"
+    if not EMAIL_RE.match(lead['email']):
+        return f"invalid email address {lead['email']!r}"
+    return None
+
+def final_status_for(mode, email_status):
+    final_status = "SENT" if mode == "live" and email_status == "SENT" else "SENT_DRY_RUN"
+    if email_status == "FAILED": final_status = "FAILED"
+    return final_status
+
+def log_email_result(lead, success, attempts=1, latency_ms=None, error=None):
+    """Records the email outcome as a send event (written off the send loop) and returns the email status"""
+    outcome = "sent" if success else "failed"
+    metrics.SMTP_SENDS.inc(outcome=outcome)
+    metrics.SMTP_ATTEMPTS.inc(attempts)
+    if latency_ms is not None:
+        metrics.SMTP_SEND_SECONDS.observe(latency_ms / 1000, outcome=outcome)
+    if success:
+        print(f"Email: Sent (via Mock Server)")
+        events.record(
+            lead['id'], "email", "SENT", attempts, latency_ms, 250, mode="live",
+            message=f"EMAIL SENT to {lead['full_name']} <{lead['email']}> [lead {lead['id']}]"
+        )
+        return "SENT"
+    print(f"Email: Failed (Max Retries Exceeded)")
+    events.record(
+        lead['id'], "email", "FAILED", attempts, latency_ms, events.smtp_code(error), error, mode="live",
+        message=f"EMAIL FAILED for {lead['full_name']} [lead {lead['id']}]"
+    )
+    return "FAILED"
+
+def log_linkedin_sent(lead, linkedin_msg):
+    print(f"LinkedIn: DM Sent (Simulated)")
+    metrics.LINKEDIN_SENDS.inc(outcome="sent")
+    events.record(
+        lead['id'], "linkedin", "SENT", mode="live",
+        message=f"LINKEDIN DM SENT to {lead['full_name']}: {linkedin_msg[:30]}... [lead {lead['id']}]"
+    )
+
+def log_dry_run(lead):
+    metrics.SMTP_SENDS.inc(outcome="dry_run")
+    metrics.LINKEDIN_SENDS.inc(outcome="dry_run")
+    events.record(lead['id'], "email", "DRY_RUN", attempt=0, mode="dry_run")
+    events.record(lead['id'], "linkedin", "DRY_RUN", attempt=0, mode="dry_run")
+
+def send_lead(lead, mode, position, total, pool=None, email_bucket=None, linkedin_bucket=None):
+    """Sends (or dry-runs) the email and LinkedIn DM for one lead and returns its final status"""
+    email_data, linkedin_msg = parse_lead_messages(lead)
+    
+    print(f"\n[{position}/{total}] 👤 {lead['full_name']} ({lead['company_name']})")
+
+    email_status = "SKIPPED"
+    if mode == "live" and email_error(lead):
+        email_status = log_email_result(lead, False, 0, error=email_error(lead))
+    elif mode == "live":
+        if email_bucket:
+            email_bucket.acquire()
+        started = time.perf_counter()
+        with metrics.SMTP_INFLIGHT.track_inprogress(), profiling.span("smtp"):
+            success, attempts, error = send_email_attempts(lead['email'], email_data.get("subject", "Hello"), email_data.get("body", "Body"), pool=pool)
+        email_status = log_email_result(lead, success, attempts, (time.perf_counter() - started) * 1000, error)
+    else:
+        print(f"Email: Dry Run Logged (Subject: {email_data.get('subject')})")
+        email_status = "DRY_RUN"
+
+    if mode == "live":
+        if linkedin_bucket:
+            linkedin_bucket.acquire()
+        log_linkedin_sent(lead, linkedin_msg)
+    else:
+        print(f"LinkedIn: Dry Run Logged")
+        log_dry_run(lead)
+
+    return final_status_for(mode, email_status)
 
-def process_sending(mode="dry_run"):
+async def send_leads_async(leads, conn, worker_id, total, messages_per_minute=None,
+                           max_sessions=None, per_domain=None, flush_every=100, job=None):
+    """
+    Live sending engine: many concurrent SMTP sessions on one event loop.
+    `leads` may be a lazily claimed stream; statuses are written back every `flush_every` leads.
+    """
+    dispatcher = AsyncDispatcher(
+        SMTP_SERVER,
+        SMTP_PORT,
+        max_sessions=max_sessions or SMTP_MAX_SESSIONS,
+        per_domain=per_domain or SMTP_PER_DOMAIN,
+        messages_per_minute=MESSAGES_PER_MINUTE if messages_per_minute is None else messages_per_minute,
+        max_retries=MAX_RETRIES
+    )
+    linkedin_bucket = TokenBucket.per_minute(LINKEDIN_PER_MINUTE, capacity=dispatcher.max_sessions)
+    cursor = conn.cursor()
+    pending = iter(leads)
+    results = []
+    sent_count = 0
+    stopping = False
+
+    def flush():
+        if results:
+            database.update_status(cursor, results, worker_id)
+            conn.commit()
+            if job:
+                job.advance(len(results))
+            results.clear()
+
+    async def send_one(lead, position):
+        email_data, linkedin_msg = parse_lead_messages(lead)
+        print(f"\n[{position}/{total}] 👤 {lead['full_name']} ({lead['company_name']})")
+
+        error = email_error(lead)
+        if error:
+            email_status = log_email_result(lead, False, 0, error=error)
+        else:
+            msg = build_email(lead['email'], email_data.get("subject", "Hello"), email_data.get("body", "Body"))
+            started = time.perf_counter()
+            with metrics.SMTP_INFLIGHT.track_inprogress(), profiling.span("smtp"):
+                success, attempts, error = await dispatcher.send(SENDER_ADDRESS, lead['email'], msg.as_bytes())
+            if error and not success:
+                print(f"SMTP Error: {error} (after {attempts} attempts)")
+            email_status = log_email_result(lead, success, attempts, (time.perf_counter() - started) * 1000, error)
+
+        await linkedin_bucket.acquire_async()
+        log_linkedin_sent(lead, linkedin_msg)
+        return final_status_for("live", email_status)
+
+    async def worker():
+        nonlocal sent_count, stopping
+        try:
+            while not stopping:
+                lead = next(pending, None)
+                if lead is None:
+                    return
+                await process(lead)
+        except BaseException:
+            # Let the other workers finish the lead in hand, so every send reaches the final flush
+            stopping = True
+            raise
+
+    async def process(lead):
+        nonlocal sent_count
+        sent_count += 1
+        try:
+            status = await send_one(lead, sent_count)
+        except Exception as e:
+            # Fail this lead only; the other workers and the status flush carry on
+            print(f"Send failed for lead {lead['id']}: {type(e).__name__}: {e}")
+            status = "FAILED"
+
+        results.append((status, lead['id']))
+        if len(results) >= flush_every:
+            flush()
+        if job:
+            job.check_cancelled()
+
+    try:
+        # More workers than sessions so leads blocked on a busy domain do not idle the pool
+        outcomes = await asyncio.gather(*(worker() for _ in range(dispatcher.max_sessions * 4)), return_exceptions=True)
+        errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+        if errors:
+            raise errors[0]
+    finally:
+        flush()
+        await dispatcher.close()
+        events.flush()
+    return sent_count
+
+def process_sending(mode="dry_run", batch_size=None, worker_id=None, pool_size=None, engine="async",
+                    messages_per_minute=None, max_sessions=None, per_domain=None, job=None):
     print(f"Starting Multi-Channel Sending (Mode: {mode})...")
 
     conn = database.get_db_connection()
     cursor = conn.cursor()
-
-    cursor.execute("SELECT * FROM leads WHERE status='MESSAGED'")
-    rows = cursor.fetchall()
+    total = database.count_leads("l.status='MESSAGED' AND l.duplicate_of IS NULL", conn=conn)
     
-    if not rows:
+    if not total:
         print("No MESSAGED leads found. Please generate messages first.")
         conn.close()
         return
 
-    print(f"Found {len(rows)} leads ready to send.")
+    print(f"Found {total} leads ready to send.")
+    if job:
+        job.set_total(total)
 
     sent_count = 0
+    if not batch_size:
+        batch_size = 50 if mode == "live" else database.STREAM_BATCH_SIZE
+
+    worker_id = worker_id or database.new_worker_id("send")
+    batches = database.iter_claimed_batches("MESSAGED", SEND_COLUMNS, worker_id, batch_size=batch_size, conn=conn)
 
-    for i, row in enumerate(rows):
-        lead = dict(row)
-        
+    if mode == "live" and engine == "async":
         try:
-            msgs = json.loads(lead['generated_messages'])
-        except:
-            msgs = {}
-
-        email_data = msgs.get("email_variant_1", {})
-        linkedin_msg = msgs.get("linkedin_variant_1", "Hi, let's connect.")
-        
-        print(f"\n[{i+1}/{len(rows)}] 👤 {lead['full_name']} ({lead['company_name']})")
-
-        email_status = "SKIPPED"
-        if mode == "live":
-            success = send_email_with_retry(lead['email'], email_data.get("subject", "Hello"), email_data.get("body", "Body"))
-            if success:
-                print(f"Email: Sent (via Mock Server)")
-                logging.info(f"EMAIL SENT to {lead['full_name']} <{lead['email']}>")
-                email_status = "SENT"
-            else:
-                print(f"Email: Failed (Max Retries Exceeded)")
-                logging.error(f"EMAIL FAILED for {lead['full_name']}")
-                email_status = "FAILED"
-        else:
-            print(f"Email: Dry Run Logged (Subject: {email_data.get('subject')})")
-            email_status = "DRY_RUN"
+            sent_count = asyncio.run(send_leads_async(
+                (lead for batch in batches for lead in batch),
+                conn,
+                worker_id,
+                total,
+                messages_per_minute=messages_per_minute,
+                max_sessions=max_sessions,
+                per_domain=per_domain,
+                job=job
+            ))
+        finally:
+            batches.close()
+            conn.close()
 
-        if mode == "live":
-            time.sleep(0.5)
-            print(f"LinkedIn: DM Sent (Simulated)")
-            logging.info(f"LINKEDIN DM SENT to {lead['full_name']}: {linkedin_msg[:30]}...")
-        else:
-            print(f"LinkedIn: Dry Run Logged")
+        print(f"\nDone! Processed {sent_count} leads.")
+        print(f"Check '{outreach_log.LOG_FILE}' for detailed history.")
+        return
 
-        final_status = "SENT" if mode == "live" and email_status == "SENT" else "SENT_DRY_RUN"
-        if email_status == "FAILED": final_status = "FAILED"
+    pool = None
+    sender = None
+    if mode == "live":
+        rate = MESSAGES_PER_MINUTE if messages_per_minute is None else messages_per_minute
+        email_bucket = TokenBucket.per_minute(rate, capacity=1)
+        linkedin_bucket = TokenBucket.per_minute(LINKEDIN_PER_MINUTE, capacity=1)
+        pool = SMTPConnectionPool(pool_size or SMTP_POOL_SIZE)
+        sender = ThreadPoolExecutor(max_workers=pool.size)
 
-        cursor.execute("UPDATE leads SET status=? WHERE id=?", (final_status, lead['id']))
-        sent_count += 1
+    try:
+        for leads in batches:
+            positions = range(sent_count + 1, sent_count + len(leads) + 1)
+            if sender:
+                # Pipeline the batch across the pooled sessions; pacing comes from the token buckets
+                with profiling.span("smtp"):
+                    statuses = list(sender.map(
+                        lambda lead, position: send_lead(lead, mode, position, total, pool, email_bucket, linkedin_bucket),
+                        leads, positions
+                    ))
+            else:
+                statuses = [send_lead(lead, mode, position, total) for lead, position in zip(leads, positions)]
 
-        if mode == "live" and i < len(rows) - 1:
-            time.sleep(DELAY_BETWEEN_MSGS)
+            database.update_status(cursor, [(status, lead['id']) for status, lead in zip(statuses, leads)], worker_id)
+            conn.commit()
+            sent_count += len(leads)
+            if job:
+                job.advance(len(leads))
+                job.check_cancelled()
+    finally:
+        batches.close()
+        conn.close()
+        if sender:
+            sender.shutdown()
+            pool.close()
+        events.flush()
 
-    conn.commit()
-    conn.close()
     print(f"\nDone! Processed {sent_count} leads.")
-    print(f"Check 'outreach.log' for detailed history.")
+    print(f"Check '{outreach_log.LOG_FILE}' for detailed history.")
 
 if __name__ == "__main__":
-    process_sending(mode="live")
\ No newline at end of file
+    profiling.profile_run(None, "send-messages", lambda: process_sending(mode="live"))
@@ -0,0 +1,158 @@
+import asyncio
+import random
+import socket
+from collections import defaultdict
+
+from rate_limit import TokenBucket, backoff_delay
+
+# Minimal asyncio SMTP client (plain SMTP, no TLS/AUTH, same as the smtplib path
+# against the local mock server) plus a dispatcher that keeps many sessions open.
+
+
+HOSTNAME = socket.getfqdn()
+
+
+class SMTPResponseError(Exception):
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+        self.message = message
+
+
+class AsyncSMTPSession:
+    """One persistent SMTP connection driven by asyncio streams."""
+
+    def __init__(self, host, port, timeout=30):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    @property
+    def connected(self):
+        return self.writer is not None
+
+    async def connect(self):
+        async def handshake():
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            await self._expect(220)
+            await self._command(f"EHLO {HOSTNAME}", 250)
+
+        try:
+            await asyncio.wait_for(handshake(), self.timeout)
+        except BaseException:
+            await self.close()
+            raise
+
+    async def _read_reply(self):
+        lines = []
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionError("SMTP server closed the connection")
+            lines.append(line[4:].decode(errors="replace").rstrip())
+            if line[3:4] != b"-":
+                return int(line[:3]), "\n".join(lines)
+
+    async def _expect(self, *codes):
+        code, message = await self._read_reply()
+        if code not in codes:
+            raise SMTPResponseError(code, message)
+        return code, message
+
+    async def _command(self, line, *codes):
+        self.writer.write(line.encode() + b"\r\n")
+        await self.writer.drain()
+        return await self._expect(*codes)
+
+    async def _transaction(self, from_addr, to_addrs, data):
+        await self._command(f"MAIL FROM:<{from_addr}>", 250)
+        for rcpt in to_addrs:
+            await self._command(f"RCPT TO:<{rcpt}>", 250, 251)
+        await self._command("DATA", 354)
+
+        # Normalize line endings and dot-stuff per RFC 5321
+        lines = data.replace(b"\r\n", b"\n").split(b"\n")
+        payload = b"\r\n".join(b"." + l if l.startswith(b".") else l for l in lines)
+        self.writer.write(payload + b"\r\n.\r\n")
+        await self.writer.drain()
+        await self._expect(250)
+
+    async def send(self, from_addr, to_addrs, data):
+        """Sends one message (bytes). Rejections RSET the session, connection errors close it."""
+        if not self.connected:
+            await self.connect()
+        try:
+            # One timeout for the whole transaction rather than one per reply line
+            await asyncio.wait_for(self._transaction(from_addr, to_addrs, data), self.timeout)
+        except SMTPResponseError:
+            try:
+                await self._command("RSET", 250)
+            except (SMTPResponseError, OSError, ConnectionError, asyncio.TimeoutError):
+                await self.close()
+            raise
+        except (OSError, ConnectionError, asyncio.TimeoutError):
+            await self.close()
+            raise
+
+    async def close(self):
+        if self.writer is None:
+            return
+        writer, self.writer, self.reader = self.writer, None, None
+        try:
+            writer.write(b"QUIT\r\n")
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except (OSError, ConnectionError):
+            pass
+
+
+class AsyncDispatcher:
+    """
+    Sends through up to `max_sessions` concurrent SMTP sessions.
+    Limits: at most `per_domain` in-flight messages per recipient domain and
+    a global `messages_per_minute` budget (0 = unlimited). Failed sends are
+    retried with exponential backoff and jitter.
+    """
+
+    def __init__(self, host, port, max_sessions=16, per_domain=4, messages_per_minute=60,
+                 max_retries=2, backoff_base=0.5, backoff_cap=30.0):
+        self.max_sessions = max_sessions
+        self.per_domain = per_domain
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.bucket = TokenBucket.per_minute(messages_per_minute, capacity=max(1, max_sessions))
+        self.sessions = asyncio.Queue()
+        for _ in range(max_sessions):
+            self.sessions.put_nowait(AsyncSMTPSession(host, port))
+        self.domain_limits = defaultdict(lambda: asyncio.Semaphore(self.per_domain))
+        self.rng = random.Random()
+
+    async def send(self, from_addr, to_email, data):
+        """Returns (success, attempts, last_error)."""
+        domain = to_email.rsplit("@", 1)[-1].lower()
+        last_error = None
+
+        async with self.domain_limits[domain]:
+            for attempt in range(self.max_retries + 1):
+                await self.bucket.acquire_async()
+                session = await self.sessions.get()
+                try:
+                    await session.send(from_addr, [to_email], data)
+                    return True, attempt + 1, None
+                except (SMTPResponseError, OSError, ConnectionError, asyncio.TimeoutError) as e:
+                    last_error = e
+                finally:
+                    self.sessions.put_nowait(session)
+
+                if attempt < self.max_retries:
+                    await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_cap, self.rng))
+
+        return False, self.max_retries + 1, last_error
+
+    async def close(self):
+        while not self.sessions.empty():
+            await self.sessions.get_nowait().close()
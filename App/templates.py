@@ -0,0 +1,211 @@
+import json
+import os
+import random
+import string
+import threading
+import time
+
+import metrics
+import rules
+
+# Message template engine. Template sets live in templates.json (MESSAGE_TEMPLATES),
+# are compiled once into plain Python functions and are reloaded when the file changes.
+
+TEMPLATES_PATH = os.getenv("MESSAGE_TEMPLATES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates.json"))
+TEMPLATE_CHECK_SECONDS = float(os.getenv("TEMPLATE_CHECK_SECONDS", "2"))
+
+FIELDS = ("first_name", "company", "role", "industry")
+_formatter = string.Formatter()
+
+class TemplateError(ValueError):
+    pass
+
+def _parts(text, escape):
+    """Splits a template into literal/field source fragments (validated against FIELDS)"""
+    parts = []
+    for literal, field, spec, conversion in _formatter.parse(text):
+        if literal:
+            parts.append(repr(escape(literal)))
+        if field is None:
+            continue
+        if field not in FIELDS or spec or conversion:
+            raise TemplateError(f"Unsupported placeholder {{{field}}} in template: {text[:40]!r}")
+        parts.append(field)
+    return parts or ["''"]
+
+def _json_literal(text):
+    return json.dumps(text)[1:-1]
+
+def _compile(expr, name):
+    code = compile(f"lambda {', '.join(FIELDS)}: {expr}", f"<template {name}>", "eval")
+    return eval(code, {})
+
+class CompiledVariant:
+    """
+    One email template plus the shared follow-up and LinkedIn lines, compiled into two functions:
+    `as_dict` builds the messages dict and `as_json` builds the exact json.dumps() string
+    directly from pre-escaped fields, so batch rendering skips json.dumps per lead.
+    """
+
+    def __init__(self, name, email, follow_up, linkedin):
+        layout = [
+            ("email_variant_1", email),
+            ("email_variant_2", follow_up),
+            ("linkedin_variant_1", linkedin[0]),
+            ("linkedin_variant_2", linkedin[1]),
+        ]
+
+        dict_items = []
+        json_parts = ["'{'"]
+        for i, (key, value) in enumerate(layout):
+            json_parts.append(repr(("" if i == 0 else ", ") + json.dumps(key) + ": "))
+            if isinstance(value, dict):
+                subject = _parts(value["subject"], str)
+                body = _parts(value["body"], str)
+                dict_items.append(f"{key!r}: {{'subject': {' + '.join(subject)}, 'body': {' + '.join(body)}}}")
+                json_parts += ["'{\"subject\": \"'", *_parts(value["subject"], _json_literal),
+                               "'\", \"body\": \"'", *_parts(value["body"], _json_literal), "'\"}'"]
+            else:
+                dict_items.append(f"{key!r}: {' + '.join(_parts(value, str))}")
+                json_parts += ["'\"'", *_parts(value, _json_literal), "'\"'"]
+        json_parts.append("'}'")
+
+        self.as_dict = _compile("{" + ", ".join(dict_items) + "}", name)
+        self.as_json = _compile(" + ".join(json_parts), name)
+
+class TemplateSet:
+    """A loaded, compiled template file"""
+
+    def __init__(self, data, path=None, mtime=None):
+        self.path = path
+        self.mtime = mtime
+        self.default_category = data.get("default_category", "Generic")
+        self.fallback = data["fallback"]
+        self.fallback_json = json.dumps(self.fallback)
+        self.variants = {}
+
+        follow_up = data["follow_up"]
+        linkedin = data["linkedin"]
+        if len(linkedin) != 2:
+            raise TemplateError("Exactly two LinkedIn templates are required")
+        for category, spec in data["categories"].items():
+            if not spec.get("emails"):
+                raise TemplateError(f"Category {category!r} has no email templates")
+            self.variants[category] = [
+                CompiledVariant(f"{category}:{i}", email, follow_up, linkedin)
+                for i, email in enumerate(spec["emails"])
+            ]
+        if self.default_category not in self.variants:
+            raise TemplateError(f"Default category {self.default_category!r} is not defined")
+
+        self.categories = rules.RuleSet(
+            [(category, spec.get("keywords", [])) for category, spec in data["categories"].items()],
+            self.default_category
+        )
+
+    @classmethod
+    def load(cls, path=TEMPLATES_PATH):
+        """Raises OSError, or TemplateError for any invalid content (bad JSON, wrong structure, bad placeholders)"""
+        with open(path, encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+            except ValueError as e:
+                raise TemplateError(f"Invalid JSON in {path}: {e}") from e
+        mtime = os.path.getmtime(path)
+        try:
+            return cls(data, path, mtime)
+        except TemplateError:
+            raise
+        except Exception as e:
+            # Wrong structure (a list where a dict belongs, missing keys, ...) surfaces as all sorts of errors
+            raise TemplateError(f"Malformed template file {path}: {type(e).__name__}: {e}") from e
+
+    def resolve_category(self, industry):
+        """Maps a raw industry string to a template category: exact name first, then the keyword rules"""
+        if industry in self.variants:
+            return industry
+        return self.categories.classify(industry)
+
+    def render(self, lead, rng=random):
+        """Messages dict for one lead (the fallback set when name fields are missing)"""
+        metrics.TEMPLATE_RENDERS.inc()
+        name_parts = (lead.get('full_name') or '').split()
+        if not name_parts:
+            return dict(self.fallback)
+        industry = lead.get('industry') or self.default_category
+        variants = self.variants[self.resolve_category(industry)]
+        variant = variants[int(rng.random() * len(variants))]
+        return variant.as_dict(name_parts[0], lead.get('company_name') or 'your company', lead.get('role') or 'Leader', industry)
+
+    def render_batch(self, leads, rng=random):
+        """
+        Renders every lead in one pass.
+        Returns (messages_json, "TEMPLATE", lead_id) tuples ready for database.update_messages.
+        """
+        started = time.perf_counter()
+        resolve = self.resolve_category
+        variants = self.variants
+        default = self.default_category
+        rows = []
+        for lead in leads:
+            name_parts = (lead['full_name'] or '').split()
+            if not name_parts:
+                rows.append((self.fallback_json, "TEMPLATE", lead['id']))
+                continue
+            industry = lead['industry'] or default
+            options = variants[resolve(industry)]
+            variant = options[int(rng.random() * len(options))]
+            rows.append((
+                variant.as_json(
+                    _json_literal(name_parts[0]),
+                    _json_literal(lead['company_name'] or 'your company'),
+                    _json_literal(lead['role'] or 'Leader'),
+                    _json_literal(industry)
+                ),
+                "TEMPLATE",
+                lead['id']
+            ))
+        metrics.TEMPLATE_RENDER_SECONDS.observe(time.perf_counter() - started)
+        metrics.TEMPLATE_RENDERS.inc(len(rows))
+        return rows
+
+_current = None
+_checked = 0.0
+_rejected_mtime = None
+_lock = threading.Lock()
+
+def reload(path=None):
+    """Loads and compiles the template file again; the old set stays active if the new one is invalid"""
+    global _current, _checked
+    template_set = TemplateSet.load(path or (_current.path if _current else TEMPLATES_PATH))
+    with _lock:
+        _current = template_set
+        _checked = time.monotonic()
+    return template_set
+
+def get_templates():
+    """The active template set, reloaded automatically when the file's mtime changes"""
+    global _checked, _rejected_mtime
+    if _current is None:
+        return reload()
+    if time.monotonic() - _checked >= TEMPLATE_CHECK_SECONDS:
+        _checked = time.monotonic()
+        mtime = None
+        try:
+            mtime = os.path.getmtime(_current.path)
+            if mtime not in (_current.mtime, _rejected_mtime):
+                print(f"Templates changed, reloading {_current.path}")
+                return reload()
+        except (OSError, TemplateError) as e:
+            # Remember the broken version so it is not re-parsed on every check
+            _rejected_mtime = mtime
+            print(f"Template reload failed ({e}), keeping the previous set.")
+    return _current
+
+def describe():
+    template_set = get_templates()
+    return {
+        "path": template_set.path,
+        "loaded_mtime": template_set.mtime,
+        "categories": {name: len(variants) for name, variants in template_set.variants.items()}
+    }
@@ -0,0 +1,5 @@
+import re
+
+# Checks shared by the importer and the sender.
+
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
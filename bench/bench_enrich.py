@@ -0,0 +1,81 @@
+"""
+AI enrichment cost per prompt batch size, against the fake LLM client.
+
+For each K in --batch-sizes, seeds a fresh database, enriches every lead with
+enrich_leads.enrich_data_async (K leads per request) and reports request count,
+token usage and wall time. The response cache is off unless LLM_CACHE is set.
+
+    python bench/bench_enrich.py --leads 2000 --batch-sizes 1,5,10,20
+    python bench/bench_enrich.py --leads 500 --latency 0.3 --token-latency 0.002 --drop-rate 0.05
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "App"))
+os.environ.setdefault("LLM_CACHE", "off")
+
+import database
+import enrich_leads
+import generate_leads
+from fake_llm import FakeAsyncLLMClient
+
+
+def run(leads, prompt_batch, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure(os.path.join(tmp, "bench.db"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_leads.generate_leads(leads, seed=1)
+
+        llm = FakeAsyncLLMClient(
+            latency=args.latency, token_latency=args.token_latency, drop_rate=args.drop_rate, seed=1
+        )
+        conn = database.get_db_connection()
+        rows = conn.execute(database.select_leads_sql(enrich_leads.ENRICH_COLUMNS)).fetchall()
+
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            done = asyncio.run(enrich_leads.enrich_data_async(
+                rows, llm, conn,
+                concurrency=args.concurrency,
+                requests_per_minute=0,
+                prompt_batch=prompt_batch
+            ))
+        elapsed = time.perf_counter() - started
+        conn.close()
+        database.manager.close_all()
+
+    return {
+        "prompt_batch": prompt_batch,
+        "leads": done,
+        "requests": llm.calls,
+        "prompt_tokens": llm.prompt_tokens,
+        "completion_tokens": llm.completion_tokens,
+        "tokens_per_lead": round((llm.prompt_tokens + llm.completion_tokens) / done, 1),
+        "seconds": round(elapsed, 3),
+        "leads_per_sec": round(done / elapsed, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=1000)
+    parser.add_argument("--batch-sizes", default="1,5,10,20")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2, help="fixed seconds per request")
+    parser.add_argument("--token-latency", type=float, default=0.001, help="extra seconds per completion token")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="share of leads left out of batched answers")
+    args = parser.parse_args()
+
+    results = [run(args.leads, int(k), args) for k in args.batch_sizes.split(",")]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
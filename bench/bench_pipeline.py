@@ -0,0 +1,335 @@
+"""
+Throughput of every pipeline stage end to end, with no network access.
+
+For each N in --leads a fresh database is seeded with generate_leads, enriched
+offline, templated, and sent live through the mock_server SMTP stand-in (run
+in its own process, as in bench_smtp.py). The AI paths run on a separate
+sample of --ai-leads leads, because their cost is set by the fake LLM's
+latency rather than by N. Those paths are enrichment with the async fake
+client and message generation with the sync one. Each N runs in a child
+process, so peak RSS is not carried over from a smaller run.
+
+Per stage the report gives:
+- leads/sec;
+- p50/p95/p99 latency per unit of work (`latency_per`). This is per shard for
+  seeding and per claimed batch for the offline stages, which process each batch
+  before claiming the next. For sending it is per email, and for the AI stages per
+  LLM request. Those stages consume claims lazily, so per-batch time there would
+  mostly measure the hand-off;
+- peak RSS during the stage;
+- database size afterwards.
+
+The output is JSON. Save it with --output and compare a later run with --baseline.
+
+    python bench/bench_pipeline.py --leads 1000,100000,1000000 --output bench-results.json
+    python bench/bench_pipeline.py --leads 1000 --baseline bench-results.json --max-regression 0.2
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, redirect_stdout
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "App"))
+os.environ.setdefault("LLM_CACHE", "off")
+os.environ.setdefault("OUTREACH_LOG", os.path.join(tempfile.gettempdir(), "bench-outreach.log"))
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import database
+import enrich_leads
+import generate_leads
+import generate_messages
+import metrics
+import send_messages
+from bench_smtp import free_port, serve
+from fake_llm import FakeAsyncLLMClient, FakeLLMClient
+
+
+def percentiles(samples):
+    """Nearest-rank p50/p95/p99 of a list of seconds, in milliseconds"""
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None}
+    ordered = sorted(samples)
+    pick = lambda pct: round(ordered[min(len(ordered) - 1, int(pct * len(ordered)))] * 1000, 3)
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+def current_rss():
+    """Resident set size in bytes (Linux /proc; elsewhere the process peak so far)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        if resource is None:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RSSSampler:
+    """Polls RSS on a thread so each stage gets its own peak"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def reset(self):
+        self.peak = current_rss()
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+
+
+@contextmanager
+def timed_batches(owner, name, samples):
+    """
+    Swaps the generator function `owner.name` for one that records the time from
+    each batch being handed out to the next one being asked for (claim + processing).
+    """
+    original = getattr(owner, name)
+
+    def wrapper(*args, **kwargs):
+        batches = original(*args, **kwargs)
+        try:
+            started = time.perf_counter()
+            for batch in batches:
+                yield batch
+                now = time.perf_counter()
+                samples.append(now - started)
+                started = now
+        finally:
+            batches.close()
+
+    setattr(owner, name, wrapper)
+    try:
+        yield
+    finally:
+        setattr(owner, name, original)
+
+
+@contextmanager
+def observed(histogram, samples):
+    """Also collects every value the metrics.Histogram `histogram` observes (per email, per request)"""
+    original = histogram.observe
+
+    def observe(value, **labels):
+        samples.append(value)
+        original(value, **labels)
+
+    histogram.observe = observe
+    try:
+        yield
+    finally:
+        del histogram.observe
+
+
+def db_bytes(path):
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+def run_stage(name, leads, func, per, source, sampler, db_path, quiet):
+    """`source` is a Histogram to sample, or (module, generator function name) to time per batch"""
+    samples = []
+    timer = observed(source, samples) if isinstance(source, metrics.Histogram) else timed_batches(*source, samples)
+    sampler.reset()
+    started = time.perf_counter()
+    with timer, redirect_stdout(quiet):
+        func()
+    elapsed = time.perf_counter() - started
+    return {
+        "stage": name,
+        "leads": leads,
+        "seconds": round(elapsed, 3),
+        "leads_per_sec": round(leads / elapsed, 1) if elapsed else None,
+        "latency_per": per,
+        "samples": len(samples),
+        "latency_ms": percentiles(samples),
+        "peak_rss_mb": round(sampler.peak / 2**20, 1),
+        "db_mb": round(db_bytes(db_path) / 2**20, 2)
+    }
+
+
+def run_size(leads, args, smtp_port):
+    """All stages for one N; runs in a child process"""
+    send_messages.SMTP_SERVER = "localhost"
+    send_messages.SMTP_PORT = smtp_port
+    send_messages.LINKEDIN_PER_MINUTE = 0
+    generate_messages.AI_PACING_SECONDS = args.pacing
+    claims = (database, "iter_claimed_batches")
+    sampler = RSSSampler()
+    stages = []
+
+    with open(os.devnull, "w", encoding="utf-8") as quiet, tempfile.TemporaryDirectory(dir=args.workdir) as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        database.configure(db_path)
+        stage = lambda *a: stages.append(run_stage(*a, sampler, db_path, quiet))
+
+        stage("seed", leads, lambda: generate_leads.generate_leads(leads, seed=args.seed, workers=args.workers),
+              "shard", (generate_leads, "iter_shards"))
+        stage("enrich_offline", leads, lambda: enrich_leads.enrich_data(mode="batch"), "batch", claims)
+        stage("messages_template", leads, lambda: generate_messages.generate_messages(mode="batch"), "batch", claims)
+        stage("send", leads, lambda: send_messages.process_sending(
+            mode="live", messages_per_minute=0, max_sessions=args.sessions, per_domain=args.per_domain
+        ), "email", metrics.SMTP_SEND_SECONDS)
+        conn = database.get_db_connection()
+        stages[-1]["emails"] = dict(conn.execute(
+            "SELECT status, COUNT(*) FROM send_events WHERE channel='email' GROUP BY status"
+        ).fetchall())
+        conn.close()
+
+        # AI paths on their own sample database
+        sample = min(leads, args.ai_leads)
+        db_path = os.path.join(tmp, "bench-ai.db")
+        database.configure(db_path)
+        with redirect_stdout(quiet):
+            generate_leads.generate_leads(sample, seed=args.seed)
+
+        async_llm = FakeAsyncLLMClient(latency=args.latency, jitter=args.jitter, token_latency=args.token_latency, seed=1)
+        stage("enrich_ai", sample, lambda: enrich_leads.enrich_data(
+            mode="ai", llm_client=async_llm, concurrency=args.concurrency, requests_per_minute=10**9, use_cache=False
+        ), "request", metrics.LLM_REQUEST_SECONDS)
+        sync_llm = FakeLLMClient(latency=args.latency, jitter=args.jitter, token_latency=args.token_latency, seed=1)
+        stage("messages_ai", sample, lambda: generate_messages.generate_messages(
+            mode="auto", llm_client=sync_llm, use_cache=False
+        ), "request", metrics.LLM_REQUEST_SECONDS)
+        for result, llm in ((stages[-2], async_llm), (stages[-1], sync_llm)):
+            result.update(requests=llm.calls, prompt_tokens=llm.prompt_tokens, completion_tokens=llm.completion_tokens)
+
+        database.manager.close_all()
+
+    sampler.close()
+    return {"leads": leads, "stages": stages, "peak_rss_mb": round(max(s["peak_rss_mb"] for s in stages), 1)}
+
+
+def child(leads, args, smtp_port, results):
+    results.put(run_size(leads, args, smtp_port))
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+
+def compare(current, baseline):
+    """Relative change per (N, stage, stage size) against an earlier report; negative throughput change = slower"""
+    previous = {(run["leads"], s["stage"], s["leads"]): s for run in baseline["runs"] for s in run["stages"]}
+    changes = []
+    for run in current["runs"]:
+        for stage in run["stages"]:
+            old = previous.get((run["leads"], stage["stage"], stage["leads"]))
+            if not old or not old["leads_per_sec"] or not stage["leads_per_sec"]:
+                continue
+            # Only compare latencies measured over the same unit of work
+            same_unit = old.get("latency_per") == stage["latency_per"]
+            old_p95 = old["latency_ms"]["p95"] if same_unit else None
+            new_p95 = stage["latency_ms"]["p95"]
+            changes.append({
+                "leads": run["leads"],
+                "stage": stage["stage"],
+                "leads_per_sec": [old["leads_per_sec"], stage["leads_per_sec"]],
+                "throughput_change": round(stage["leads_per_sec"] / old["leads_per_sec"] - 1, 3),
+                "p95_change": round(new_p95 / old_p95 - 1, 3) if old_p95 and new_p95 else None,
+                "peak_rss_change": round(stage["peak_rss_mb"] / old["peak_rss_mb"] - 1, 3) if old["peak_rss_mb"] else None
+            })
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", default="1000", help="comma separated sizes, e.g. 1000,100000,1000000")
+    parser.add_argument("--ai-leads", type=int, default=200, help="sample size for the AI enrichment and message stages")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1, help="generate_leads worker processes")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake LLM seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random fake LLM seconds per request")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="extra fake LLM seconds per completion token")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent AI enrichment requests")
+    parser.add_argument("--pacing", type=float, default=0.0, help="pause after each AI message request (production: 1.2)")
+    parser.add_argument("--sessions", type=int, default=16, help="SMTP sessions for live sending")
+    parser.add_argument("--per-domain", type=int, default=4)
+    parser.add_argument("--workdir", help="directory for the benchmark databases (default: system temp)")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--max-regression", type=float,
+                        help="exit 1 if any stage's throughput dropped by more than this fraction of the baseline")
+    args = parser.parse_args()
+
+    port = free_port()
+    ready = multiprocessing.Event()
+    stop = multiprocessing.Event()
+    received = multiprocessing.Value("i", 0)
+    server = multiprocessing.Process(target=serve, args=(port, ready, stop, received))
+    server.start()
+    ready.wait(10)
+
+    report = {"environment": environment(), "settings": vars(args), "runs": []}
+    try:
+        for leads in (int(n) for n in args.leads.split(",")):
+            results = multiprocessing.Queue()
+            worker = multiprocessing.Process(target=child, args=(leads, args, port, results))
+            worker.start()
+            run = None
+            while run is None:
+                try:
+                    run = results.get(timeout=1)
+                except queue.Empty:
+                    if not worker.is_alive():
+                        raise RuntimeError(f"Benchmark run for N={leads} failed (exit code {worker.exitcode})")
+            worker.join()
+            report["runs"].append(run)
+            print(f"N={leads}: " + ", ".join(f"{s['stage']} {s['leads_per_sec']}/s" for s in run["stages"]), file=sys.stderr)
+    finally:
+        stop.set()
+        server.join()
+    report["server_received"] = received.value
+
+    regressed = False
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f))
+        if args.max_regression is not None:
+            regressed = any(c["throughput_change"] < -args.max_regression for c in report["comparison"])
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
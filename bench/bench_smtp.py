@@ -0,0 +1,146 @@
+"""
+SMTP sending throughput against the in-process mock_server stand-in.
+
+Compares one connection per email (the old behaviour), the pooled
+persistent sessions of the threaded sender, and the asyncio dispatcher
+used by live send_messages.process_sending.
+
+    python bench/bench_smtp.py --messages 2000 --pool-size 8
+    python bench/bench_smtp.py --messages 20000 --sessions 64 --domains 50 --only async
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "App"))
+
+from aiosmtpd.controller import Controller
+
+import mock_server
+import send_messages
+from smtp_dispatcher import AsyncDispatcher
+
+
+def serve(port, ready, stop, received):
+    """Runs the quiet mock SMTP server in its own process, so it does not share the client's GIL."""
+    handler = mock_server.CustomHandler(verbose=False)
+    controller = Controller(handler, hostname="localhost", port=port)
+    controller.start()
+    ready.set()
+    stop.wait()
+    controller.stop()
+    received.value = handler.received
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def result(messages, sent, elapsed):
+    return {
+        "messages": messages,
+        "sent": sent,
+        "seconds": round(elapsed, 3),
+        "messages_per_sec": round(messages / elapsed, 1)
+    }
+
+
+def run_threaded(messages, pool_size):
+    sender = ThreadPoolExecutor(max_workers=pool_size)
+    pool = send_messages.SMTPConnectionPool(pool_size)
+
+    def send_one(i, pooled):
+        return send_messages.send_email_with_retry(
+            f"lead{i}@example.com", f"Subject {i}", "Hi there, are you free for a 15-min call?",
+            pool=pool if pooled else None
+        )
+
+    results = {}
+    for label, pooled in (("per_message_connection", False), ("pooled_sessions", True)):
+        start = time.perf_counter()
+        sent = sum(sender.map(lambda i: send_one(i, pooled), range(messages)))
+        results[label] = result(messages, sent, time.perf_counter() - start)
+
+    sender.shutdown()
+    pool.close()
+    return results
+
+
+async def run_async(messages, sessions, per_domain, domains, messages_per_minute):
+    dispatcher = AsyncDispatcher(
+        send_messages.SMTP_SERVER,
+        send_messages.SMTP_PORT,
+        max_sessions=sessions,
+        per_domain=per_domain,
+        messages_per_minute=messages_per_minute
+    )
+    payload = send_messages.build_email(
+        "lead@example.com", "Subject", "Hi there, are you free for a 15-min call?"
+    ).as_bytes()
+    queue = iter(range(messages))
+    sent = 0
+
+    async def worker():
+        nonlocal sent
+        for i in queue:
+            ok, _, _ = await dispatcher.send(send_messages.SENDER_ADDRESS, f"lead{i}@domain{i % domains}.com", payload)
+            sent += ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(sessions * 4)))
+    elapsed = time.perf_counter() - start
+    await dispatcher.close()
+
+    summary = result(messages, sent, elapsed)
+    summary.update({"sessions": sessions, "per_domain": per_domain, "domains": domains})
+    return {"async_dispatcher": summary}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--sessions", type=int, default=32, help="async dispatcher SMTP sessions")
+    parser.add_argument("--per-domain", type=int, default=8)
+    parser.add_argument("--domains", type=int, default=100, help="distinct recipient domains")
+    parser.add_argument("--rate", type=int, default=0, help="messages per minute budget (0 = unlimited)")
+    parser.add_argument("--only", choices=["threaded", "async"])
+    args = parser.parse_args()
+
+    port = free_port()
+    ready = multiprocessing.Event()
+    stop = multiprocessing.Event()
+    received = multiprocessing.Value("i", 0)
+    server = multiprocessing.Process(target=serve, args=(port, ready, stop, received))
+    server.start()
+    ready.wait(10)
+    send_messages.SMTP_PORT = port
+    send_messages.SMTP_SERVER = "localhost"
+
+    results = {}
+    try:
+        if args.only != "async":
+            results.update(run_threaded(args.messages, args.pool_size))
+            results["pool_size"] = args.pool_size
+        if args.only != "threaded":
+            results.update(asyncio.run(run_async(
+                args.messages, args.sessions, args.per_domain, args.domains, args.rate
+            )))
+    finally:
+        stop.set()
+        server.join()
+
+    results["server_received"] = received.value
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Template rendering throughput for message generation.
+
+Compares the per-lead str.format + json.dumps approach generate_messages used
+before with the compiled renderers in templates.py, on the same template file.
+
+    python bench/bench_templates.py --leads 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "App"))
+
+import generate_leads
+import templates
+
+
+def make_leads(count):
+    rows = generate_leads.build_shard((0, count, 1))
+    return [
+        {"id": row[0], "full_name": row[1], "company_name": row[2], "role": row[3], "industry": row[4]}
+        for row in rows
+    ]
+
+
+def render_format(template_data, leads, rng):
+    """The old path: keyword fallback chain, str.format per string and json.dumps per lead"""
+    categories = template_data["categories"]
+    follow_up = template_data["follow_up"]
+    linkedin = template_data["linkedin"]
+    rows = []
+    for lead in leads:
+        first_name = lead['full_name'].split()[0]
+        industry = lead['industry']
+        category = industry if industry in categories else "Generic"
+        if category == "Generic":
+            for name, spec in categories.items():
+                if any(x in industry.lower() for x in spec["keywords"]):
+                    category = name
+                    break
+        tmpl = rng.choice(categories[category]["emails"])
+        fields = {"first_name": first_name, "company": lead['company_name'], "role": lead['role'], "industry": industry}
+        msgs = {
+            "email_variant_1": {"subject": tmpl["subject"].format(**fields), "body": tmpl["body"].format(**fields)},
+            "email_variant_2": {"subject": follow_up["subject"].format(**fields), "body": follow_up["body"].format(**fields)},
+            "linkedin_variant_1": linkedin[0].format(**fields),
+            "linkedin_variant_2": linkedin[1].format(**fields)
+        }
+        rows.append((json.dumps(msgs), "TEMPLATE", lead['id']))
+    return rows
+
+
+def timed(func, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=50000)
+    args = parser.parse_args()
+
+    leads = make_leads(args.leads)
+    with open(templates.TEMPLATES_PATH, encoding="utf-8") as f:
+        template_data = json.load(f)
+
+    started = time.perf_counter()
+    template_set = templates.reload()
+    compile_seconds = time.perf_counter() - started
+
+    format_seconds = timed(render_format, template_data, leads, random.Random(1))
+    compiled_seconds = timed(template_set.render_batch, leads, random.Random(1))
+
+    print(json.dumps({
+        "leads": args.leads,
+        "compile_seconds": round(compile_seconds, 4),
+        "format_leads_per_sec": round(args.leads / format_seconds),
+        "compiled_leads_per_sec": round(args.leads / compiled_seconds),
+        "speedup": round(format_seconds / compiled_seconds, 2)
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
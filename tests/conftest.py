@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Module-level settings are read at import, so point them at scratch files first
+SCRATCH = tempfile.mkdtemp(prefix="leadgen-tests-")
+os.environ.setdefault("LLM_CACHE_DB", os.path.join(SCRATCH, "llm_cache.db"))
+os.environ.setdefault("OUTREACH_LOG", os.path.join(SCRATCH, "outreach.log"))
+os.environ.setdefault("PROFILE_DIR", os.path.join(SCRATCH, "profiles"))
+os.environ.setdefault("GROQ_API_KEY", "")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "App"))
+
+import database
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A fresh, migrated leads database for one test"""
+    database.configure(str(tmp_path / "leads.db"))
+    database.init_db()
+    yield database
+    database.manager.close_all()
+
+
+def add_leads(count, status="NEW", **columns):
+    """Inserts `count` leads L0..L{count-1} with the given status and extra columns"""
+    conn = database.get_db_connection()
+    names = ["id", "full_name", "company_name", "role", "industry", "email", "linkedin_url", "status", *columns]
+    rows = [
+        (f"L{i}", f"Lead {i}", "Acme", "CTO", "Technology", f"lead{i}@acme{i}.com",
+         f"linkedin.com/in/lead-{i}", status, *columns.values())
+        for i in range(count)
+    ]
+    conn.executemany(f"INSERT INTO leads ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})", rows)
+    conn.commit()
+    conn.close()
+    return [row[0] for row in rows]
@@ -0,0 +1,35 @@
+import enrich_leads
+from conftest import add_leads
+
+COLUMNS = ["id", "email"]
+
+
+def mark_duplicate(db, lead_id, of="L0"):
+    conn = db.get_db_connection()
+    conn.execute("UPDATE leads SET duplicate_of=? WHERE id=?", (of, lead_id))
+    conn.commit()
+    conn.close()
+
+
+def test_claims_skip_marked_duplicates(db):
+    add_leads(4)
+    mark_duplicate(db, "L2")
+
+    claimed = db.claim_leads("NEW", "w1", 10, COLUMNS)
+    by_id = db.claim_lead_ids(["L2", "L3"], "NEW", "w2", COLUMNS, lease_seconds=0)
+
+    assert sorted(lead["id"] for lead in claimed) == ["L0", "L1", "L3"]
+    assert by_id == []
+
+
+def test_stages_leave_duplicates_alone(db):
+    add_leads(5)
+    mark_duplicate(db, "L4")
+
+    enrich_leads.enrich_data(mode="batch")
+
+    conn = db.get_db_connection()
+    statuses = dict(conn.execute("SELECT id, status FROM leads").fetchall())
+    conn.close()
+    assert statuses.pop("L4") == "NEW"
+    assert set(statuses.values()) == {"ENRICHED"}
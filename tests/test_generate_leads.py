@@ -0,0 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import generate_leads
+
+
+def test_shards_built_in_threads_match_a_serial_run():
+    specs = [(i, 500, generate_leads.shard_seed(42, i)) for i in range(6)]
+    serial = [generate_leads.build_shard(spec) for spec in specs]
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        threaded = list(pool.map(generate_leads.build_shard, specs))
+
+    assert threaded == serial
+
+
+def test_same_seed_gives_same_leads(db):
+    query = "SELECT id, email FROM leads ORDER BY rowid"
+    assert generate_leads.generate_leads(300, seed=7, shard_size=100)["count"] == 300
+    conn = db.get_db_connection()
+    first = [tuple(row) for row in conn.execute(query)]
+    conn.execute("DELETE FROM leads")
+    conn.commit()
+
+    generate_leads.generate_leads(300, seed=7, shard_size=100, workers=2)
+
+    assert [tuple(row) for row in conn.execute(query)] == first
+    conn.close()
@@ -0,0 +1,41 @@
+import tempfile
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+import jobs
+
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    return tmp_path
+
+
+def test_cleanup_runs_for_a_job_cancelled_before_it_starts(db):
+    manager = jobs.JobManager(max_workers=1)
+    release = threading.Event()
+    calls, cleaned = [], []
+
+    blocker = manager.submit("block", lambda job: release.wait(10))
+    queued = manager.submit("queued", lambda job: calls.append(job.id), cleanup=lambda: cleaned.append(True))
+    manager.cancel(queued)
+    release.set()
+
+    assert manager.wait(queued, timeout=10)["status"] == "CANCELLED"
+    assert manager.wait(blocker, timeout=10)["status"] == "DONE"
+    assert calls == [] and cleaned == [True]
+
+
+def test_import_upload_is_not_left_behind(db, spool_dir):
+    client = TestClient(api.app)
+    upload = ("leads.csv", b"full_name,email\nAda Lovelace,ada@example.com\n", "text/csv")
+
+    rejected = client.post("/import-leads", files={"file": upload}, data={"profile": "bogus"})
+    done = client.post("/import-leads", files={"file": upload}, data={"wait": "true"})
+
+    assert rejected.status_code == 400
+    assert done.status_code == 200 and done.json()["job"]["result"]["inserted"] == 1
+    assert list(spool_dir.glob("import_*")) == []
@@ -0,0 +1,28 @@
+import enrich_leads
+import llm_cache
+import llm_client
+from conftest import add_leads
+from fake_llm import FakeAsyncLLMClient
+
+
+def cache_activity():
+    stats = llm_cache.cache.stats()
+    return stats["hits"] + stats["misses"], stats["stores"], stats["entries"]
+
+
+def test_enrich_without_cache_never_touches_it(db):
+    add_leads(20)
+    before = cache_activity()
+
+    enrich_leads.enrich_data(mode="ai", llm_client=FakeAsyncLLMClient(latency=0, seed=1),
+                             requests_per_minute=10**9, use_cache=False)
+
+    assert cache_activity() == before
+    assert db.count_leads("l.status='ENRICHED'") == 20
+
+
+def test_wrap_keeps_an_existing_wrapper_unless_asked():
+    bypassing = llm_client.wrap(FakeAsyncLLMClient(latency=0), use_cache=False)
+    assert llm_client.wrap(bypassing) is bypassing
+    assert llm_client.wrap(bypassing, use_cache=False) is bypassing
+    assert not llm_client.wrap(bypassing, use_cache=True).bypass
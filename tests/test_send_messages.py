@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+import pytest
+
+import events
+import jobs
+import send_messages
+from conftest import add_leads
+
+MESSAGES = json.dumps({"email_variant_1": {"subject": "Hi", "body": "Hello"}, "linkedin_variant_1": "Hi"})
+
+
+class FakeDispatcher:
+    """Stands in for AsyncDispatcher: every send succeeds after a short delay"""
+
+    def __init__(self, *args, max_sessions=16, **kwargs):
+        self.max_sessions = max_sessions
+
+    async def send(self, from_addr, to_email, data):
+        await asyncio.sleep(0.005)
+        return True, 1, None
+
+    async def close(self):
+        # The real close() awaits the SMTP quits, giving other workers time to run
+        await asyncio.sleep(0.1)
+
+
+class CancelAfter:
+    """Job stand-in that reports cancellation once `limit` leads were processed"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.checks = 0
+        self.processed = 0
+        self.total = None
+
+    def set_total(self, total):
+        self.total = total
+
+    def advance(self, count=1):
+        self.processed += count
+
+    def check_cancelled(self):
+        self.checks += 1
+        if self.checks >= self.limit:
+            raise jobs.JobCancelled("cancelled by test")
+
+
+@pytest.fixture
+def fake_smtp(monkeypatch):
+    monkeypatch.setattr(send_messages, "AsyncDispatcher", FakeDispatcher)
+    monkeypatch.setattr(send_messages, "LINKEDIN_PER_MINUTE", 0)
+
+
+def test_cancel_mid_send_records_every_sent_lead(db, fake_smtp):
+    add_leads(300, status="MESSAGED", generated_messages=MESSAGES)
+
+    with pytest.raises(jobs.JobCancelled):
+        send_messages.process_sending(mode="live", messages_per_minute=0, max_sessions=4, job=CancelAfter(30))
+    events.flush()
+
+    conn = db.get_db_connection()
+    emailed = {row[0] for row in conn.execute("SELECT lead_id FROM send_events WHERE channel='email' AND status='SENT'")}
+    still_messaged = {row[0] for row in conn.execute("SELECT id FROM leads WHERE status='MESSAGED'")}
+    conn.close()
+
+    assert emailed
+    assert not emailed & still_messaged
+    assert len(still_messaged) == 300 - len(emailed)
+
+
+def test_leads_without_a_valid_email_fail_without_stopping_the_run(db, fake_smtp):
+    add_leads(3, status="MESSAGED", generated_messages=MESSAGES)
+    conn = db.get_db_connection()
+    conn.execute("UPDATE leads SET email=NULL WHERE id='L1'")
+    conn.execute("UPDATE leads SET email='not-an-address' WHERE id='L2'")
+    conn.commit()
+
+    send_messages.process_sending(mode="live", messages_per_minute=0)
+
+    statuses = dict(conn.execute("SELECT id, status FROM leads").fetchall())
+    conn.close()
+    assert statuses == {"L0": "SENT", "L1": "FAILED", "L2": "FAILED"}
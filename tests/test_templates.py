@@ -0,0 +1,55 @@
+import json
+import os
+
+import pytest
+
+import templates
+
+GOOD = {
+    "fallback": {"email_variant_1": {"subject": "Hello", "body": "Hi there"}},
+    "follow_up": {"subject": "Following up", "body": "Hi {first_name}"},
+    "linkedin": ["Hi {first_name}", "Thanks {first_name}"],
+    "categories": {"Generic": {"emails": [{"subject": "Hi {first_name}", "body": "About {company}"}]}}
+}
+
+
+@pytest.fixture
+def template_file(tmp_path, monkeypatch):
+    for name in ("_current", "_checked", "_rejected_mtime"):
+        monkeypatch.setattr(templates, name, getattr(templates, name))
+    monkeypatch.setattr(templates, "TEMPLATE_CHECK_SECONDS", 0)
+    path = tmp_path / "templates.json"
+    path.write_text(json.dumps(GOOD), encoding="utf-8")
+    templates.reload(str(path))
+    return path
+
+
+def rewrite(path, content):
+    path.write_text(content, encoding="utf-8")
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+
+@pytest.mark.parametrize("content", [
+    json.dumps({**GOOD, "categories": [GOOD["categories"]]}),
+    json.dumps({**GOOD, "linkedin": "not a list"}),
+    json.dumps([GOOD]),
+    json.dumps({**GOOD, "follow_up": {"subject": "{unknown}", "body": ""}}),
+    "{not json",
+])
+def test_hot_reload_keeps_the_last_good_set(template_file, content):
+    good = templates.get_templates()
+    rewrite(template_file, content)
+
+    assert templates.get_templates() is good
+    with pytest.raises(templates.TemplateError):
+        templates.reload()
+
+
+def test_hot_reload_picks_up_a_valid_change(template_file):
+    good = templates.get_templates()
+    rewrite(template_file, json.dumps({**GOOD, "linkedin": ["Hey {first_name}", "Bye"]}))
+
+    reloaded = templates.get_templates()
+    assert reloaded is not good
+    assert reloaded.render({"full_name": "Ada L", "industry": "Generic"})["linkedin_variant_1"] == "Hey Ada"